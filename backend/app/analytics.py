@@ -6,6 +6,7 @@ from db.db_service import DBService
 from sqlalchemy import Column, DateTime, Float, Integer, String, select, func, extract
 from db.schema import DetectionData, SalesData
 from typing import List
+from utils.live_state import read_live_state, running_live_state_feeds
 
 router = InferringRouter()
 
@@ -294,3 +295,12 @@ def get_all_feed_data(parameters: QueryParameters):
     print(result_dict)
     return result_dict
 
+# Live counts, occupancy, fps and last event time per section, read from the shared memory the running feeds
+# publish to. No database access, dashboards can poll this as often as they like.
+@router.get("/live")
+def get_live_counts(feed_id: int = None):
+    feed_ids = [feed_id] if feed_id is not None else running_live_state_feeds()
+    feeds = [state for state in map(read_live_state, feed_ids) if state is not None]
+    if feed_id is not None and not feeds:
+        raise HTTPException(status_code=404, detail="Feed is not running")
+    return {"feeds": feeds}
@@ -14,10 +14,25 @@ from pydantic import Field
 from fastapi.responses import StreamingResponse, Response
 import json
 import platform
+import signal
 from multiprocessing import shared_memory
+from utils.feed_stats import read_feed_stats
+from utils.frame_bus import FrameBusReader, acquire_frame_waiter, frame_bus_name, release_frame_waiter
+import time
 
 router = APIRouter()
 
+# Shared inference server process, started on demand by the first feed configured with inference_mode "server"
+inference_server_proc = None
+
+def ensureInferenceServer():
+    global inference_server_proc
+    if inference_server_proc is not None and inference_server_proc.poll() is None:
+        return
+    # If another server already owns the address (e.g. started before an API reload) this one exits on its own.
+    # The first start of an install creates the secret the server and the feeds authenticate with.
+    inference_server_proc = subprocess.Popen(['python', 'inference_server.py', '--create-key'])
+
 class FeedInDB(BaseModel):
     cameraId: str 
     name: str 
@@ -85,6 +100,15 @@ def getFeedStatus(feed_id: int):
         raise HTTPException(status_code=404, detail="Feed not found")
     return feed.status
 
+# Fetch runtime metrics published by the running avian process (fps, load level, frame cost, ...)
+# offline=true returns the stats of a re-analysis of a recording of the feed instead
+@router.get("/feed-stats/{feed_id}")
+def getFeedStats(feed_id: int, offline: bool = False):
+    stats = read_feed_stats("offline_" + str(feed_id) if offline else feed_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No stats available for feed")
+    return stats
+
 def setFeedStatus(feed_status, feed_id):
     db = DBService().get_session()
     feed = db.query(FeedMaster).filter(FeedMaster.id == feed_id).first()
@@ -116,6 +140,47 @@ def feedTargetResolution(feed_id: int):
     target_width = int(config['target_width'])
     return {"target_height": target_height, "target_width": target_width}
 
+class CalibrationParams(BaseModel):
+    numFrames: int = 100
+    frameStride: int = 5
+    minPersonHeight: int = 40
+    percentile: float = 10
+    apply: bool = True
+
+# Measure person sizes on the feed and pick the smallest inference size that keeps people above minPersonHeight.
+# With apply the result is saved in the feed config and used the next time the feed starts.
+@router.post("/calibrate/{feed_id}")
+def calibrateFeed(feed_id: int, params: CalibrationParams = CalibrationParams()):
+    db = DBService().get_session()
+    feed = db.query(FeedMaster).filter(FeedMaster.id == feed_id).first()
+    if feed is None:
+        raise HTTPException(status_code=404, detail="Feed not found")
+
+    config = eval(feed.config) if feed.config else {}
+    classes = json.loads(config["classes_to_count"]) if config.get("classes_to_count") is not None else [0]
+    # Imported here, calibration loads the detector (torch, ultralytics) which the API process does not need otherwise
+    from calibration import calibrate_feed
+    try:
+        # Same engine as the feed runs, an exported model detects differently from its PyTorch original
+        stats = calibrate_feed(feed.url, config.get("model_name", "yolov8n.pt"), classes=classes,
+                               num_frames=params.numFrames, frame_stride=params.frameStride,
+                               min_person_height=params.minPersonHeight, percentile=params.percentile,
+                               detector_backend=str(config.get("detector_backend", "ultralytics")),
+                               detector_args={"imgsz": int(config.get("imgsz", 640)),
+                                              "int8": str(config.get("detector_int8", "false")).lower() == "true",
+                                              "data": config.get("int8_calibration_data")})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if params.apply:
+        config["person_size"] = stats
+        if stats["imgsz"] is not None:
+            config["imgsz"] = stats["imgsz"]
+        feed.config = str(config)
+        feed.modified_at = datetime.now()
+        db.commit()
+    return stats
+
 # Get feed image
 @router.get("/feed-image/{feed_id}")
 def feedImage(feed_id: int):
@@ -138,6 +203,11 @@ def feedImage(feed_id: int):
 # Start feed
 @router.post("/start-feed/{feed_id}")
 async def startFeed(feed_id: int):
+    db = DBService().get_session()
+    feed = db.query(FeedMaster).filter(FeedMaster.id == feed_id).first()
+    if feed is not None and feed.config is not None and str(eval(feed.config).get("inference_mode", "local")) == "server":
+        ensureInferenceServer()
+
     # Start the avian python program with the feed_id
     proc = subprocess.Popen(['python', 'avian.py', str(feed_id)])#, shell=True)
     # Store pid in db
@@ -197,12 +267,24 @@ async def saveRegions(feed_id: int, request: Request):
     regions = data.get('regions', [])
 
     for region in regions:
-        parsed_region = [
-        (region['topLeft']['x'], region['topLeft']['y']),
-        (region['topRight']['x'], region['topRight']['y']),
-        (region['bottomRight']['x'], region['bottomRight']['y']),
-        (region['bottomLeft']['x'], region['bottomLeft']['y'])
-        ]
+        section_type = "entry_exit"
+        if 'points' in region:
+            # Tripwire polyline or zone polygon ("type": "zone") of {x, y} points
+            section_type = "zone" if region.get('type') == "zone" else "tripwire"
+            parsed_region = [(point['x'], point['y']) for point in region['points']]
+        elif 'entry' in region:
+            # Bent entry and exit lines: {"entry": [{x, y}, ...], "exit": [{x, y}, ...]}
+            parsed_region = {
+                'entry': [(point['x'], point['y']) for point in region['entry']],
+                'exit': [(point['x'], point['y']) for point in region['exit']]
+            }
+        else:
+            parsed_region = [
+            (region['topLeft']['x'], region['topLeft']['y']),
+            (region['topRight']['x'], region['topRight']['y']),
+            (region['bottomRight']['x'], region['bottomRight']['y']),
+            (region['bottomLeft']['x'], region['bottomLeft']['y'])
+            ]
         # Save regions in db
         db = DBService().get_session()
         # Get feed_master details
@@ -218,11 +300,11 @@ async def saveRegions(feed_id: int, request: Request):
             camera_id=camera_id,
             feed_id=feed_id,
             coordinates=coordinates,
-            section_type="entry_exit",
+            section_type=section_type,
             extras=""
         )
         section_id = save_section(db, section)
-        section.section_name = f"entry_exit_{section_id}"
+        section.section_name = f"{section_type}_{section_id}"
         db.commit()
         # Append section_id to feed_master
         sections = json.loads(feed.sections) if feed.sections is not None else []
@@ -230,39 +312,47 @@ async def saveRegions(feed_id: int, request: Request):
         
         feed.sections = json.dumps(sections)
         db.commit()
+
+    # Let a running avian process pick up the new sections
+    running = DBService().get_session().query(PIDMaster).filter(PIDMaster.feed_id == feed_id).first()
+    if running is not None and hasattr(signal, "SIGHUP"):
+        try:
+            os.kill(running.pid, signal.SIGHUP)
+        except ProcessLookupError:
+            pass
     return {"message": "Regions saved successfully"}
     
 @router.get('/view-feed/{feed_id}')
 async def view_feed(feed_id: int):
 
-    pipe_name = "/tmp/avian_pipe_" + str(feed_id)
-    pipe_fd = os.open(pipe_name, os.O_RDONLY)# | os.O_NONBLOCK)
-    def generate():
-        while True:
-            try:
-                dimensions = os.read(pipe_fd, 3 * 4)
-                width, height, size = np.frombuffer(dimensions, dtype=np.int32)
-                #struct.unpack('iii', dimensions)
-                frame_size = width * height * size
-                frame_bytes = os.read(pipe_fd, frame_size)
-                if not frame_bytes:
-                    print("No frame bytes")
-                    break  # End of file reached
-                
-                frame = np.frombuffer(frame_bytes, dtype=np.uint8)
-                frame = frame.reshape((height, width, size))
-                
-                # Convert frame to jpeg
-                _, img_encoded = cv2.imencode('.jpg', frame)
-                frame_bytes_display = img_encoded.tobytes()
-                yield (
-                    b'--frame\r\n'
-                    b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes_display + b'\r\n'
-                )
-            except Exception as e:
-                if e.errno == errno.EAGAIN or e.errno == errno.EWOULDBLOCK:
-                    print('No data available to read.')
-                else:
-                    print(e)
+    reader = FrameBusReader.attach(frame_bus_name(feed_id))
+    if reader is None:
+        raise HTTPException(status_code=404, detail="Feed is not running")
+
+    async def generate():
+        last_seq = 0
+        # Shared with the websocket viewers of the feed in this process, woken by every published frame
+        waiter = acquire_frame_waiter(feed_id)
+        try:
+            while True:
+                frame = reader.read(last_seq)
+                if frame is not None:
+                    last_seq, timestamp, image = frame
+                    # Convert frame to jpeg straight from shared memory
+                    is_success, img_encoded = cv2.imencode('.jpg', image)
+                    # No view into the segment may outlive the encode, reader.close() can only unmap it without
+                    del frame, image
+                    if is_success and reader.is_valid(last_seq):
+                        frame_bytes_display = img_encoded.tobytes()
+                        yield (
+                            b'--frame\r\n'
+                            b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes_display + b'\r\n'
+                        )
+                        continue
+                # Sleep until the worker publishes the next frame, the timeout keeps the reader heartbeat alive
+                await waiter.wait(timeout=1.0)
+        finally:
+            release_frame_waiter(feed_id)
+            reader.close()
 
     return StreamingResponse(generate(), media_type="multipart/x-mixed-replace;boundary=frame")
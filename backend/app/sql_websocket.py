@@ -21,6 +21,8 @@ import array
 import numpy as np
 import cv2
 import logging
+import time
+from utils.frame_bus import FrameBusReader, acquire_frame_waiter, frame_bus_name, release_frame_waiter
 
 sys.path.append(str(Path(__file__).resolve().parents[2]))
 
@@ -35,6 +37,7 @@ connected_clients: Set[WebSocket] = set()
 connected_clients_stream: Set[WebSocket] = set()
 
 messagesReceived = []
+
 logger = logging.getLogger(__name__)
 
 #manager = ConnectionManager()
@@ -97,6 +100,14 @@ async def broadcast_notification(payload: str):
         except WebSocketDisconnect:
             connected_clients.remove(client)
 
+async def send_stream(client, image_bytes, feed_id):
+    if image_bytes is None:
+        return
+    try:
+        await client.send_json({'feed_id': feed_id, "image": image_bytes, 'type': 'stream'})
+    except (WebSocketDisconnect, RuntimeError):
+        connected_clients_stream.discard(client)
+
 async def broadcast_stream(image_bytes, feed_id):
     if image_bytes is None:
         return
@@ -112,22 +123,20 @@ async def broadcast_stream(image_bytes, feed_id):
 async def startup():
     asyncio.create_task(listen_for_notifications())
 
-def consume_data(buffer):
-    while struct.unpack('i', buffer[:4])[0] != 0:
-        pass
-    
-    buffer[:4] = array.array("i", [2]).tobytes()
-    frame_length = struct.unpack('i', buffer[4:8])[0] # get frame length
-    if frame_length == 0:
-        # Unlock
-        buffer[:4] = array.array("i", [0]).tobytes()
-        return None
-
-    frame_bytes = buffer[8:frame_length+8] # get frame bytes
-    buffer[:4] = array.array("i", [0]).tobytes()
-
-    frame_bytes_to_send = base64.b64encode(frame_bytes.tobytes()).decode()
-    return frame_bytes_to_send
+def consume_data(reader, after_seq):
+    # Encode straight from the shared memory view, then check the slot was not overwritten meanwhile
+    frame = reader.read(after_seq)
+    if frame is None:
+        return after_seq, None
+
+    seq, timestamp, image = frame
+    is_success, im_buf_arr = cv2.imencode(".jpg", image)
+    del image
+    if not is_success or not reader.is_valid(seq):
+        return seq, None
+
+    frame_bytes_to_send = base64.b64encode(im_buf_arr.tobytes()).decode()
+    return seq, frame_bytes_to_send
     
 async def close_websocket_connection(websocket: WebSocket):
     try:
@@ -148,35 +157,46 @@ async def stream_websocket_endpoint(streamsocket: WebSocket, feed_id: str):
     for client in connected_clients_stream.copy():
         logging.error("Connected Client: ", client)
 
-    shm_test = None
-
-    flag = 0
+    reader = None
+    last_seq = 0
+    last_frame_time = time.time()
+    waiter = acquire_frame_waiter(feed_id)
     print("Stream Client connected", streamsocket)
     try:
-        while True:
-            if flag == 0:
-                try:
-                    shm_name = "avian_shm_" + feed_id
-                    shm_test = shared_memory.SharedMemory(name=shm_name)
-                    flag = 1
-                except:
-                    data = 0
-                    await asyncio.sleep(0.1)
+        while streamsocket in connected_clients_stream:
+            if reader is None:
+                reader = FrameBusReader.attach(frame_bus_name(feed_id))
+                if reader is None:
+                    await asyncio.sleep(0.5)
                     continue
-
-            if flag == 1:
-                if shm_test != None:
-                    data = consume_data(shm_test.buf)
-                
-            await asyncio.sleep(0.1) #TBD: Reduce and check behaviour
-
-            if data != 0 or data is not None:
-                await broadcast_stream(data, feed_id)
-                data = None
+                last_seq = 0
+                last_frame_time = time.time()
+
+            last_seq, data = consume_data(reader, last_seq)
+            if data is not None:
+                last_frame_time = time.time()
+                # Each stream socket is for one feed, only its own viewer needs the frame
+                await send_stream(streamsocket, data, feed_id)
+            elif time.time() - last_frame_time > 5:
+                # Worker restarted or stopped, its segment may have been replaced
+                reader.close()
+                reader = None
+                continue
+
+            # A frame published while sending woke the waiter already, read it without waiting. There is no await
+            # between this check and the waiter taking its future, so a later frame cannot be missed either.
+            # (A frame still being written is not ready yet, its notification wakes the waiter.)
+            if data is not None and reader.latest_seq() > last_seq:
+                continue
+            # Sleep until the worker publishes the next frame, the timeout keeps the reader heartbeat alive
+            await waiter.wait(timeout=1.0)
 
     except WebSocketDisconnect:
-        shm_test.close()
-        shm_test.unlink()
+        pass
+    finally:
+        if reader is not None:
+            reader.close()
+        release_frame_waiter(feed_id)
         await close_websocket_connection(streamsocket)
 
     # await manager.connect(websocket)
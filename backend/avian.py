@@ -13,6 +13,18 @@ import os
 import fcntl
 import errno
 from db.db_queries import DBQueries
+from inference_server import InferenceClient
+from detectors import load_detector
+from load_controller import LoadController
+from motion_gate import MotionGate
+from roi import RoiCropper
+from capture import CaptureThread, open_capture
+from pipeline import Stage
+from event_writer import EventWriter
+from utils.frame_bus import FrameBusWriter, frame_bus_name
+from utils.feed_stats import FeedStats
+from utils.live_state import LiveStateWriter
+import time
 from multiprocessing import shared_memory
 import struct
 import array
@@ -22,6 +34,9 @@ import threading
 
 #from connection_manager import ConnectionManager
 
+# Sent through the counting stage after a section reload
+RELOAD_COUNTERS = object()
+
 async def send_image_to_websocket(feed_id, im0, websocket):
     # async with websockets.connect("ws://127.0.0.1:8000/stream") as websocket:
     #resize im0 to 250x250
@@ -31,25 +46,50 @@ async def send_image_to_websocket(feed_id, im0, websocket):
     data = json.dumps({'feed_id': feed_id, 'image': byte_im, 'type': 'stream'})
     await websocket.send(data)
 
-class CameraThread(threading.Thread):
-        def __init__(self, camera, name='CameraThread'):
-            self.camera = camera
-            self.last_frame = None
-            super(CameraThread, self).__init__(name=name)
-            self.start()
-
-        def run(self):
-            while True:
-                ret, self.last_frame = self.camera.read() 
-
 class Avian:
            
-    def __init__(self, section_obj, feed_url, config, feed_id, camera_id, query):
+    def __init__(self, section_obj, feed_url, config, feed_id, camera_id, query, model_factory=None, event_writer=None,
+                 live=True):
         self.video_path = feed_url
-        self.model = YOLO(config["model_name"])
-        self.cap = cv2.VideoCapture(feed_url)
+        # "ffmpeg" decodes in a subprocess that already scales to target size and decimates to capture_fps
+        self.capture_backend = str(config.get("capture_backend", "opencv"))
+        capture_fps = float(config.get("capture_fps", 0)) or None
+        # With OpenCV the capture thread itself decimates to capture_fps, grabbing the frames it drops
+        self.capture_target_fps = capture_fps if self.capture_backend != "ffmpeg" else None
+        self.open_capture = lambda: open_capture(feed_url, self.capture_backend, int(config["target_width"]),
+                                                 int(config["target_height"]), capture_fps)
+        self.cap = self.open_capture()
         assert self.cap.isOpened(), "Error reading video file"
         self.w, self.h, self.fps = (int(self.cap.get(x)) for x in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FPS))
+        if not self.w or not self.h:
+            # Some streams only know their size once a frame is decoded. The source is reopened afterwards so that a
+            # file still starts at its first frame.
+            ret, image = self.cap.read()
+            self.cap.release()
+            if not ret or image is None:
+                raise RuntimeError(f"Could not read the frame size of {feed_url}")
+            self.h, self.w = image.shape[:2]
+            print("Source reports no frame size, using the decoded", self.w, "x", self.h)
+            self.cap = self.open_capture()
+            assert self.cap.isOpened(), "Error reading video file"
+        # "server" shares one batched model across all feeds (see inference_server.py), "local" loads it in-process
+        self.inference_mode = str(config.get("inference_mode", "local"))
+        # detector_backend picks the engine (ultralytics, onnx, openvino or replay), see detectors/
+        # detect_interval > 1 detects every k frames and predicts tracks in between (local mode only)
+        if model_factory is not None:
+            # Supplied by the host process, e.g. a model shared in-process by ingest_host.py, called with the fps
+            self.model = model_factory(self.fps or 30)
+        elif self.inference_mode == "server":
+            if str(config.get("detector_backend", "ultralytics")) == "replay":
+                raise ValueError("detector_backend replay runs in local inference mode only")
+            if int(config.get("detect_interval", 1)) > 1:
+                print("detect_interval is not supported in server inference mode, detecting every frame")
+            self.model = InferenceClient(feed_id, config["model_name"], fps=self.fps or 30,
+                                         backend=str(config.get("detector_backend", "ultralytics")),
+                                         detector_args={"imgsz": int(config.get("imgsz", 640)),
+                                                        "int8": str(config.get("detector_int8", "false")).lower() == "true"})
+        else:
+            self.model = load_detector(config, fps=self.fps or 30)
         self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)) #FIXME: Check if this is valid for streaming
         self.classes_to_count = json.loads(config["classes_to_count"]) if config["classes_to_count"] is not None else [0]
         self.num_save_frames = int(config["save_frames"])
@@ -57,23 +97,93 @@ class Avian:
         self.num_buffer_size = int(config["buffer_size"])
         self.format_width = int(config["target_width"]) #or w
         self.format_height = int(config["target_height"]) #or h
+        # Sections are drawn on the target_width x target_height image, frames are processed at their native size.
+        # Geometry is mapped to source coordinates once here instead of resizing every frame to target size.
+        self.scale_x = self.w / self.format_width
+        self.scale_y = self.h / self.format_height
         self.sections = section_obj
         self.track_confidence= float(config["track_confidence"])
         self.feed_id = feed_id
         self.camera_id = camera_id
         self.query_obj = query
         #self.manager = ConnectionManager()
-        self.shm_name = "avian_shm_" + str(self.feed_id)
-        self.shm_test = shared_memory.SharedMemory(name=self.shm_name, create=True, size=4096000)
         self.websocket = None
+        # Only the live worker of a feed has a preview and live counts, a re-analysis of a recording (see
+        # offline.py) keeps its stats apart and can run next to it
+        self.frame_bus = None
+        self.live_state = None
+        if live:
+            # Raw 250x250 preview frames for the API, readers map them without copying
+            self.frame_bus = FrameBusWriter(frame_bus_name(self.feed_id), 250, 250, 3,
+                                            slot_count=int(config.get("frame_bus_slots", 4)))
+            # Live counts per section in shared memory for the /analytics/live endpoint, written at most every
+            # live_state_interval seconds by the counting stage
+            self.live_state = LiveStateWriter(self.feed_id)
+        self.stats = FeedStats(self.feed_id if live else "offline_" + str(self.feed_id))
+        self.live_state_interval = float(config.get("live_state_interval", 0.2))
+        self.live_state_published = 0
+        # Latency/fps targets for load shedding, the camera fps is the default target
+        self.load_controller = LoadController(target_fps=float(config.get("target_fps", capture_fps or self.fps or 0)) or None,
+                                              max_latency_ms=float(config.get("max_latency_ms", 0)) or None,
+                                              imgsz=int(config.get("imgsz", 640)))
+        # Skip inference on static frames, sensitivity is the fraction of section pixels that must change
+        self.motion_gate = None
+        if str(config.get("motion_gate", "false")).lower() == "true":
+            self.motion_gate = MotionGate(regions=[self.section_outline(section) for section in self.sections],
+                                          sensitivity=float(config.get("motion_sensitivity", 0.005)),
+                                          refresh_interval=int(config.get("motion_refresh_frames", 50)))
+        # Run the detector only on the bounding box of all sections plus a margin (in pixels)
+        self.roi_cropper = None
+        if str(config.get("roi_crop", "false")).lower() == "true":
+            self.roi_cropper = RoiCropper([self.section_outline(section) for section in self.sections],
+                                          margin=int(config.get("roi_margin", 32)))
+        self.reload_sections = False
+        self.capture_pacing = str(config.get("capture_pacing", "source_fps"))
+        self.capture_ring_size = int(config.get("capture_ring_size", 4))
+        self.pipeline_queue_size = int(config.get("pipeline_queue_size", 4))
+        self.ee_counter_array = []
+        # "false" falls back to one ObjectCounter per section
+        self.feed_counter = str(config.get("feed_counter", "true")).lower() == "true"
+        # Frames after which the state of a track that is no longer seen is dropped
+        self.track_ttl = int(config.get("track_ttl_frames", 300))
+        # Counters queue their events to a background writer, "false" writes each event synchronously
+        self.owns_event_writer = False
+        self.event_writer = event_writer
+        if self.event_writer is None and str(config.get("event_writer", "true")).lower() == "true":
+            self.event_writer = EventWriter(query.db.get_engine(), batch_size=int(config.get("event_batch_size", 200)),
+                                            flush_interval=float(config.get("event_flush_interval", 1.0)))
+            self.event_writer.start()
+            self.owns_event_writer = True
+        self.events = self.event_writer or query
+        # Spatial index over the section lines, only the lines near a track are tested
+        self.section_index = str(config.get("section_index", "true")).lower() == "true"
+        # Resolution of the zone mask relative to the frame
+        self.zone_mask_scale = float(config.get("zone_mask_scale", 0.5))
+        self.cam_thread = None
+        # Set while run_tracker / run_offline run, SIGTERM then asks them to stop through stopping
+        self.running = False
+        self.stopping = False
         signal.signal(signal.SIGTERM, self.sigterm_handler)
+        # The API sends SIGHUP after sections were saved for this feed
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.sighup_handler)
     
+    def sighup_handler(self, signum, frame):
+        self.reload_sections = True
+
     def sigterm_handler(self, signum, frame):
         print('SIGTERM received, closing resources for feed id: ', self.feed_id)
+        if self.running:
+            # The run loop stops capture, drains the pipeline stages and flushes the queued events itself
+            self.stopping = True
+            return
+        if self.cam_thread is not None:
+            self.cam_thread.stop()
         self.cap.release()
         cv2.destroyAllWindows()
-        self.shm_test.close()
-        self.shm_test.unlink()
+        self.close_outputs()
+        self.stop_event_writer()
+        self.stats.remove()
         sys.exit(0)
     
     def fast_forward_callback(self, event, x, y, flags, param):
@@ -85,87 +195,269 @@ class Avian:
             to_count = self.cap.get(cv2.CAP_PROP_POS_FRAMES) - 250 if self.cap.get(cv2.CAP_PROP_POS_FRAMES) - 250 > 0 else 0
             self.cap.set(cv2.CAP_PROP_POS_FRAMES, to_count)
 
+    def section_points(self, section):
+        points = eval(section.coordinates)
+        # Sections with bent entry/exit lines store {"entry": [...], "exit": [...]}
+        if isinstance(points, dict):
+            return {key: [(x * self.scale_x, y * self.scale_y) for x, y in line] for key, line in points.items()}
+        return [(x * self.scale_x, y * self.scale_y) for x, y in points]
+
+    def section_outline(self, section):
+        # Area covered by a section, for the motion gate and the ROI crop
+        points = self.section_points(section)
+        if isinstance(points, dict):
+            return points["entry"] + points["exit"][::-1]
+        return points
+
+    def create_counter(self, section):
+        ee_counter = counter.ObjectCounter(self.feed_id)
+        ee_counter.set_args(view_img=True,
+                        reg_pts=self.section_points(section),
+                        classes_names=self.model.names,
+                        draw_tracks=True,
+                        width = self.w,
+                        height = self.h,
+                        fps = self.fps,
+                        track_length = self.num_track_length,
+                        buffer_size = self.num_buffer_size,
+                        save_frames = self.num_save_frames,
+                        total_frames = self.frame_count,
+                        counter_name = "Counter " + str(section.id),
+                        region_id = section.id,
+                        camera_id = self.camera_id,
+                        feed_id = self.feed_id,
+                        query_obj = self.events,
+                        track_ttl = self.track_ttl
+                        )
+        return ee_counter
+
+    def create_feed_counter(self):
+        return counter.FeedCounter(self.feed_id, self.camera_id, self.events, self.model.names,
+                                   width=self.w, height=self.h,
+                                   track_length=self.num_track_length, view_img=True, draw_tracks=True,
+                                   track_ttl=self.track_ttl, section_index=self.section_index,
+                                   zone_mask_scale=self.zone_mask_scale)
+
+    def create_counters(self, current_counters=None):
+        counted_sections = [section for section in self.sections if section.section_type in ("entry_exit", "tripwire", "zone")] #FIXME: Change to feature_id in future
+        # One FeedCounter evaluates all sections in a single pass, it keeps the state of unchanged sections itself
+        if self.feed_counter:
+            feed_counter = current_counters[0] if current_counters else self.create_feed_counter()
+            feed_counter.set_sections([(section.id, self.section_points(section), section.coordinates, section.section_type)
+                                       for section in counted_sections])
+            return [feed_counter]
+
+        # ObjectCounter only knows 4 point entry_exit sections
+        entry_exit_sections = []
+        for section in counted_sections:
+            if section.section_type == "entry_exit" and not isinstance(self.section_points(section), dict):
+                entry_exit_sections.append(section)
+            else:
+                print("Section", section.id, "needs feed_counter enabled, not counting it")
+
+        # Counters of unchanged sections are kept so their counts and track state survive a reload
+        current = {(c.region_id, str(c.section_coordinates)): c for c in current_counters or []}
+        ee_counter_array = []
+        for section in entry_exit_sections:
+            ee_counter = current.get((section.id, str(section.coordinates)))
+            if ee_counter is None:
+                ee_counter = self.create_counter(section)
+                ee_counter.section_coordinates = section.coordinates
+            ee_counter_array.append(ee_counter)
+        return ee_counter_array
+
+    def track_stats(self):
+        stats = {"live_tracks": 0, "evicted_tracks": 0}
+        for ee_counter in self.ee_counter_array:
+            for key, value in ee_counter.track_stats().items():
+                stats[key] += value
+        return stats
+
+    def stop_event_writer(self):
+        # Writes the events still queued, a writer shared by a host process is stopped by the host
+        if self.owns_event_writer:
+            self.event_writer.stop()
+
+    def zone_stats(self):
+        # Occupancy, visits and average dwell per zone, only FeedCounter tracks zones
+        stats = {}
+        for ee_counter in self.ee_counter_array:
+            if hasattr(ee_counter, "zone_stats"):
+                stats.update(ee_counter.zone_stats())
+        return stats
+
+    def close_outputs(self):
+        if self.frame_bus is not None:
+            self.frame_bus.close()
+        if self.live_state is not None:
+            self.live_state.close()
+
+    def publish_live_state(self, force=False):
+        if self.live_state is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.live_state_published < self.live_state_interval:
+            return
+        self.live_state_published = now
+        sections = []
+        for ee_counter in self.ee_counter_array:
+            sections.extend(ee_counter.live_sections())
+        self.live_state.write(self.stats.get("fps", 0), sections)
+
+    def reload_regions(self):
+        # Reloads the sections and updates the motion gate and ROI crop, both only used by the inference thread.
+        # Returns False when there is nothing to reload.
+        self.reload_sections = False
+        sections = self.query_obj.get_sections(self.feed_id)
+        if sections is None:
+            return False
+        print("Reloading sections for feed id: ", self.feed_id)
+        self.sections = sections
+        regions = [self.section_outline(section) for section in self.sections]
+        if self.roi_cropper is not None:
+            self.roi_cropper.update(regions)
+        if self.motion_gate is not None:
+            self.motion_gate.set_regions(regions)
+        return True
+
+    def refresh_sections(self, ee_counter_array):
+        # For callers that infer and count on the same thread
+        if not self.reload_regions():
+            return ee_counter_array
+        return self.create_counters(ee_counter_array)
+
+    def infer(self, frame):
+        im0 = frame.image
+        # Nothing moved in the sections: skip the model, the tracker and counters keep their last state
+        if self.motion_gate is not None and not self.motion_gate.has_motion(im0):
+            self.stats.incr("motion_skipped_frames")
+            return None
+
+        self.stats.incr("inferred_frames")
+        # Native frame goes to the detector as is, ultralytics letterboxes it once to imgsz.
+        # Only a ROI crop needs a (small) contiguous copy.
+        model_input = np.ascontiguousarray(self.roi_cropper.crop(im0)) if self.roi_cropper is not None else im0
+        tracks = self.model.track(model_input, persist=True, show=False, verbose=False,
+                                  classes=self.classes_to_count, conf=self.track_confidence,
+                                  imgsz=self.load_controller.imgsz())
+        if self.roi_cropper is not None:
+            tracks = self.roi_cropper.to_frame(tracks, im0)
+        return tracks
+
+    def count_frame(self, item):
+        # Counting stage: strictly in frame order, DB writes for frame N overlap inference on frame N+1
+        if item is RELOAD_COUNTERS:
+            # The counters are only ever changed on this thread, never while they count a frame
+            self.ee_counter_array = self.create_counters(self.ee_counter_array)
+            return None
+        frame, tracks = item
+        im0 = frame.image
+        # Only frames that go to a viewer are drawn on. The API signals a viewer through the frame bus reader
+        # heartbeat, without one counting runs headless.
+        render = self.frame_bus is not None and self.load_controller.preview_enabled() and self.frame_bus.has_readers()
+        if tracks is None:
+            # Motion gated, nothing to count. The viewer still gets the frame, with the sections and last counts.
+            if not render:
+                return None
+            for ee_counter in self.ee_counter_array:
+                im0 = ee_counter.render_overlay(im0)
+        else:
+            for ee_counter in self.ee_counter_array:
+                im0 = ee_counter.start_counting(im0, tracks, frame.seq, render=render, source_frame=frame.index,
+                                                timestamp=frame.timestamp)
+            self.publish_live_state()
+        if render:
+            self.stats.incr("rendered_frames")
+            return im0
+        return None
+
+    def publish_preview(self, im0):
+        # Preview stage: single downscale of the annotated native frame into the frame bus
+        self.frame_bus.write(cv2.resize(im0, (250, 250)))
+
     # Async function to send image stream to websocket
     async def run_tracker(self):
-        ee_counter_array = []
+        self.ee_counter_array = self.create_counters()
 
-        for section in self.sections:
-            if section.section_type == "entry_exit": #FIXME: Change to feature_id in future
-                ee_counter = counter.ObjectCounter(self.feed_id)
-                ee_counter_array.append(ee_counter)
-                ee_counter.set_args(view_img=True,
-                                reg_pts=eval(section.coordinates),
-                                classes_names=self.model.names,
-                                draw_tracks=True,
-                                width = self.format_width,
-                                height = self.format_height,
-                                fps = self.fps,
-                                track_length = self.num_track_length,
-                                buffer_size = self.num_buffer_size,
-                                save_frames = self.num_save_frames,
-                                total_frames = self.frame_count,
-                                counter_name = "Counter " + str(section.id),
-                                region_id = section.id,
-                                camera_id = self.camera_id,
-                                feed_id = self.feed_id,
-                                query_obj = self.query_obj
-                                )
-
-        buffer = self.shm_test.buf
-        cam_thread = CameraThread(self.cap)
+        self.cam_thread = CaptureThread(self.video_path, self.cap, ring_size=self.capture_ring_size,
+                                        pacing=self.capture_pacing, open_fn=self.open_capture,
+                                        target_fps=self.capture_target_fps)
+        self.cam_thread.start()
+        # Capture -> inference (this thread) -> counting -> preview. Counting never drops so counts stay exact,
+        # the preview queue drops its oldest frame when the viewer side falls behind.
+        preview_stage = Stage("preview", self.publish_preview, queue_size=self.pipeline_queue_size)
+        counting_stage = Stage("counting", self.count_frame, queue_size=self.pipeline_queue_size, drop_oldest=False,
+                               output=preview_stage.input)
+        stages = [counting_stage, preview_stage]
+        for stage in stages:
+            stage.start()
         # async with websockets.connect("ws://127.0.0.1:8000/stream") as websocket:
-        while self.cap.isOpened():
-            im0 = cam_thread.last_frame
-            
-            # success, im0 = self.cap.read()
-
-            if im0 is not None:
-                im0 = cv2.resize(im0, (int(self.format_width), int(self.format_height)))
-                frame_to_send = im0      
-                frame_to_send = cv2.resize(frame_to_send, (250, 250))
-            else:
+        processed_frames = 0
+        fps_window_start = time.time()
+        last_seq = -1
+        self.running = True
+        while not self.stopping:
+            # Block until the capture thread has a frame we have not seen yet
+            frame = self.cam_thread.next_frame(last_seq, timeout=1.0)
+            if frame is None:
+                if self.cam_thread.finished:
+                    print("Video frame is empty or video processing has been successfully completed.")
+                    break
                 continue
+            last_seq = frame.seq
+
+            # Frames already queued are counted with the old sections, the counting stage then rebuilds its counters
+            if self.reload_sections and self.reload_regions():
+                counting_stage.put(RELOAD_COUNTERS)
 
-            # if not success:
-            #     print("Video frame is empty or video processing has been successfully completed.")
-            #     break
-            
+            # Frames skipped by the load level are never decoded, the capture thread only grabs them
+            self.cam_thread.frame_stride = self.load_controller.frame_stride()
+
+            self.load_controller.start_frame()
             # await send_image_to_websocket(self.feed_id, im0, websocket)
 
-            tracks = self.model.track(np.ascontiguousarray(im0), persist=True, show=False, verbose=False,
-                                classes=self.classes_to_count, conf=self.track_confidence)
-            
-            for i in range(len(ee_counter_array)):
-                im0 = ee_counter_array[i].start_counting(np.ascontiguousarray(im0), tracks, self.cap.get(cv2.CAP_PROP_POS_FRAMES))
-                #cv2.setMouseCallback("Avian Tech " + str(self.feed_id), self.fast_forward_callback)
-
-            # Wait for unlock: TBD, continuing for now
-            # while struct.unpack('i', buffer[:4])[0] != 0:
-            #     continue
-            
-            
-            #!!!NOTE: Ideally frame should be copied to a staging area first. Locking and copying to final location should be done
-            # in another thread altogether. No sleep or wait should be added when reading RTSP Streams.
-            
-            # lock for producer
-            buffer[:4] = array.array("i", [1]).tobytes()
-
-            # convert frame to bytes and get its length
-            is_success, im_buf_arr = cv2.imencode(".jpg", frame_to_send)
-            frame_bytes = im_buf_arr.tobytes()
-            frame_length = len(frame_bytes)
-
-            # put the length of frame bytes at next 4 bytes
-            buffer[4:8] = array.array("i", [frame_length]).tobytes()
-
-            # put actual frame bytes
-            buffer[8:frame_length+8] = frame_bytes
-
-            # unlock 
-            buffer[:4] = array.array("i", [0]).tobytes()
+            # Motion gated frames (no tracks) go through counting too, so the preview keeps the frame order
+            tracks = self.infer(frame)
+            counting_stage.put((frame, tracks))
+            #cv2.setMouseCallback("Avian Tech " + str(self.feed_id), self.fast_forward_callback)
+
+            self.load_controller.end_frame()
+
+            processed_frames += 1
+            if time.time() - fps_window_start >= 1:
+                self.stats.set("fps", round(processed_frames / (time.time() - fps_window_start), 2))
+                for key, value in self.cam_thread.counters().items():
+                    self.stats.set(key, value)
+                if hasattr(self.model, "counters"):
+                    for key, value in self.model.counters().items():
+                        self.stats.set(key, value)
+                for stage in stages:
+                    for key, value in stage.metrics().items():
+                        self.stats.set(key, value)
+                for key, value in self.track_stats().items():
+                    self.stats.set(key, value)
+                self.stats.set("zones", self.zone_stats())
+                if self.event_writer is not None:
+                    for key, value in self.event_writer.metrics().items():
+                        self.stats.set(key, value)
+                processed_frames = 0
+                fps_window_start = time.time()
+            self.load_controller.report(self.stats)
+            self.stats.publish()
 
+        # Let the counting stage finish the frames already inferred before shutting down
+        stopped = [stage.stop() for stage in stages]
+        self.cam_thread.stop()
         self.cap.release()
+        if all(stopped):
+            self.close_outputs()
+        else:
+            print("Pipeline stages of feed id", self.feed_id, "did not stop in time, leaving the frame bus and live state open")
+        self.stop_event_writer()
         cv2.destroyAllWindows()
+        self.running = False
+        if self.stopping:
+            self.stats.remove()
 
 def start_message():
     # Display ascii art
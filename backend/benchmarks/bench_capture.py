@@ -0,0 +1,74 @@
+# Compare the OpenCV capture path (decode full frame + cv2.resize) with the ffmpeg pipe backend
+# (scale and fps decimation inside ffmpeg) on local video files.
+#
+#   python benchmarks/bench_capture.py video1.mp4 [video2.mp4 ...] --width 1024 --height 576 --fps 10
+import argparse
+import os
+import resource
+import sys
+import time
+
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ffmpeg_capture import FFmpegCapture
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def bench_opencv(path, width, height, fps, max_frames):
+    start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+    cap = cv2.VideoCapture(path)
+    src_fps = cap.get(cv2.CAP_PROP_FPS) or fps or 1
+    # Same frames as the ffmpeg fps filter would keep
+    step = src_fps / fps if fps else 1
+    next_keep = 0.0
+    index = 0
+    frames = 0
+    while frames < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index >= next_keep:
+            cv2.resize(frame, (width, height))
+            frames += 1
+            next_keep += step
+        index += 1
+    cap.release()
+    return frames, time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+
+
+def bench_ffmpeg(path, width, height, fps, max_frames):
+    start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+    cap = FFmpegCapture(path, width, height, fps)
+    frames = 0
+    while frames < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames += 1
+    # Child CPU time is only accounted once ffmpeg has exited
+    cap.release()
+    return frames, time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark OpenCV vs ffmpeg pipe capture")
+    parser.add_argument("videos", nargs="+", help="Local video files")
+    parser.add_argument("--width", type=int, default=1024)
+    parser.add_argument("--height", type=int, default=576)
+    parser.add_argument("--fps", type=float, default=0, help="Target fps, 0 keeps the source fps")
+    parser.add_argument("--max-frames", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'video':30} {'backend':8} {'frames':>7} {'wall s':>8} {'cpu s':>8} {'fps':>8} {'cpu ms/frame':>13}")
+    for path in args.videos:
+        for name, bench in (("opencv", bench_opencv), ("ffmpeg", bench_ffmpeg)):
+            frames, wall, cpu = bench(path, args.width, args.height, args.fps or None, args.max_frames)
+            print(f"{os.path.basename(path)[:30]:30} {name:8} {frames:7d} {wall:8.2f} {cpu:8.2f} "
+                  f"{frames / wall if wall else 0:8.1f} {1000 * cpu / frames if frames else 0:13.2f}")
@@ -0,0 +1,128 @@
+# Per-frame line crossing cost of the legacy ObjectCounter loop (backtrack_length VectorUtils checks per track)
+# against the vectorised CrossingEngine, with a parity check of the recorded entry/exit events on random walks.
+#
+#   python benchmarks/bench_crossing.py --tracks 10 100 1000 --frames 200
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crossing import CrossingEngine
+from utils.vector_utils import VectorUtils
+
+REG_PTS = [(200.0, 200.0), (1000.0, 200.0), (1000.0, 500.0), (200.0, 500.0)]
+BACKTRACK_LENGTH = 10
+
+
+class Flags:
+    def __init__(self):
+        self.entered = False
+        self.exited = False
+        self.entry_started = False
+        self.exit_started = False
+
+
+def legacy_frame(chords, flags, events):
+    # Body of the old extract_and_process_tracks crossing loop, minus the database calls
+    entry_line = [REG_PTS[2], REG_PTS[3]]
+    exit_line = [REG_PTS[1], REG_PTS[0]]
+    for track_id, start_point, end_point in chords:
+        info = flags[track_id]
+        for _ in range(BACKTRACK_LENGTH):
+            track_vector = [start_point, end_point]
+            if VectorUtils.check_intersection(track_vector, entry_line):
+                cp = VectorUtils.cross_product(track_vector, entry_line)
+                if not info.entered and cp > 0 and info.entry_started:
+                    info.entered = True
+                    events.append((track_id, "entry"))
+                if cp < 0:
+                    info.exit_started = True
+            if VectorUtils.check_intersection(track_vector, exit_line):
+                cp = VectorUtils.cross_product(track_vector, exit_line)
+                if not info.exited and cp < 0 and info.exit_started:
+                    info.exited = True
+                    events.append((track_id, "exit"))
+                if cp > 0:
+                    info.entry_started = True
+
+
+def engine_frame(engine, chords, flags, events):
+    infos = [flags[track_id] for track_id, _, _ in chords]
+    entries, exits, entry_first, entry_started, exit_started = engine.step(
+        [start for _, start, _ in chords], [end for _, _, end in chords],
+        np.array([info.entered for info in infos], dtype=bool), np.array([info.exited for info in infos], dtype=bool),
+        np.array([info.entry_started for info in infos], dtype=bool),
+        np.array([info.exit_started for info in infos], dtype=bool))
+    for i, (track_id, _, _) in enumerate(chords):
+        info = infos[i]
+        info.entry_started = bool(entry_started[i])
+        info.exit_started = bool(exit_started[i])
+        if entries[i] and entry_first[i]:
+            info.entered = True
+            events.append((track_id, "entry"))
+        if exits[i]:
+            info.exited = True
+            events.append((track_id, "exit"))
+        if entries[i] and not entry_first[i]:
+            info.entered = True
+            events.append((track_id, "entry"))
+
+
+def random_walks(num_tracks, num_frames, seed=0):
+    # People walking up and down through the region, so that both lines get crossed in both directions
+    rng = np.random.default_rng(seed)
+    start = np.column_stack([rng.uniform(100, 1100, num_tracks), rng.uniform(50, 650, num_tracks)])
+    velocity = np.column_stack([rng.normal(0, 2, num_tracks), rng.choice([-1, 1], num_tracks) * rng.uniform(3, 12, num_tracks)])
+    noise = rng.normal(0, 1.5, (num_frames, num_tracks, 2))
+    positions = start[None] + velocity[None] * np.arange(num_frames)[:, None, None] + noise.cumsum(axis=0)
+    return [[(float(x), float(y)) for x, y in frame] for frame in positions]
+
+
+def chords_of(histories, frame_positions):
+    chords = []
+    for track_id, position in enumerate(frame_positions):
+        track_line = histories[track_id]
+        track_line.append(position)
+        if len(track_line) > 30:
+            track_line.pop(0)
+        if len(track_line) >= BACKTRACK_LENGTH:
+            chords.append((track_id, track_line[len(track_line) - BACKTRACK_LENGTH - 1], track_line[len(track_line) - 1]))
+    return chords
+
+
+def run(num_tracks, num_frames):
+    walks = random_walks(num_tracks, num_frames)
+    frames = []
+    histories = [[] for _ in range(num_tracks)]
+    for positions in walks:
+        frames.append(chords_of(histories, positions))
+
+    engine = CrossingEngine([[REG_PTS[2], REG_PTS[3]], [REG_PTS[1], REG_PTS[0]]])
+    results = {}
+    for name, fn in (("legacy", legacy_frame), ("engine", lambda c, f, e: engine_frame(engine, c, f, e))):
+        flags = [Flags() for _ in range(num_tracks)]
+        events = []
+        start = time.perf_counter()
+        for chords in frames:
+            fn(chords, flags, events)
+        results[name] = (1000 * (time.perf_counter() - start) / num_frames, events)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Line crossing benchmark")
+    parser.add_argument("--tracks", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'tracks':>7} {'legacy ms/frame':>16} {'engine ms/frame':>16} {'speedup':>8} {'events':>7} {'parity':>7}")
+    for num_tracks in args.tracks:
+        results = run(num_tracks, args.frames)
+        legacy_ms, legacy_events = results["legacy"]
+        engine_ms, engine_events = results["engine"]
+        print(f"{num_tracks:7d} {legacy_ms:16.3f} {engine_ms:16.3f} {legacy_ms / engine_ms:8.1f} "
+              f"{len(legacy_events):7d} {str(legacy_events == engine_events):>7}")
@@ -0,0 +1,93 @@
+# Per-frame counting cost of one ObjectCounter per section against a single FeedCounter, as sections are added
+# to a feed, with a parity check of the recorded events. The last column is the FeedCounter without a viewer
+# (nothing drawn).
+#
+#   python benchmarks/bench_feed_counter.py --sections 1 4 16 --tracks 50 --frames 200
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_crossing import random_walks
+from simple_counter import FeedCounter, ObjectCounter
+
+
+class EventLog:
+    """Stands in for the EventWriter, keeps the events in memory."""
+
+    def __init__(self):
+        self.events = []
+
+    def record_event(self, camera_id, feed_id, section_id, detection_time, attribute, frame):
+        self.events.append((section_id, attribute, frame))
+
+
+def make_sections(num_sections, width=1280, height=720):
+    # Horizontal bands stacked over the frame, each one a 4 point section
+    sections = []
+    band = height / (num_sections + 1)
+    for i in range(num_sections):
+        top = band * (i + 0.5)
+        sections.append((i + 1, [(100.0, top), (width - 100.0, top), (width - 100.0, top + band), (100.0, top + band)]))
+    return sections
+
+
+def make_frames(num_tracks, num_frames, width=1280, height=720):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    frames = []
+    for positions in random_walks(num_tracks, num_frames):
+        data = [[x - 20, y - 80, x + 20, y, track_id + 1, 0.9, 0] for track_id, (x, y) in enumerate(positions)]
+        frames.append([Results(orig_img=image, path="", names={0: "person"}, boxes=torch.tensor(data))])
+    return image, frames
+
+
+def run_object_counters(sections, image, frames):
+    log = EventLog()
+    counters = []
+    for region_id, reg_pts in sections:
+        ee_counter = ObjectCounter(1)
+        ee_counter.set_args(classes_names={0: "person"}, reg_pts=reg_pts, draw_tracks=True, region_id=region_id,
+                            query_obj=log)
+        counters.append(ee_counter)
+    start = time.perf_counter()
+    for fc, tracks in enumerate(frames):
+        im0 = image.copy()
+        for ee_counter in counters:
+            im0 = ee_counter.start_counting(np.ascontiguousarray(im0), tracks, fc)
+    return 1000 * (time.perf_counter() - start) / len(frames), log.events
+
+
+def run_feed_counter(sections, image, frames, render=True):
+    log = EventLog()
+    feed_counter = FeedCounter(1, 1, log, {0: "person"}, draw_tracks=True)
+    feed_counter.set_sections([(region_id, reg_pts, str(reg_pts)) for region_id, reg_pts in sections])
+    start = time.perf_counter()
+    for fc, tracks in enumerate(frames):
+        feed_counter.start_counting(image.copy(), tracks, fc, render=render)
+    return 1000 * (time.perf_counter() - start) / len(frames), log.events
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-section counting benchmark")
+    parser.add_argument("--sections", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--tracks", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    image, frames = make_frames(args.tracks, args.frames)
+    print(f"{'sections':>8} {'ObjectCounter ms/frame':>23} {'FeedCounter ms/frame':>21} {'events':>7} {'parity':>7} "
+          f"{'headless ms/frame':>18}")
+    for num_sections in args.sections:
+        sections = make_sections(num_sections)
+        legacy_ms, legacy_events = run_object_counters(sections, image, frames)
+        feed_ms, feed_events = run_feed_counter(sections, image, frames)
+        headless_ms, headless_events = run_feed_counter(sections, image, frames, render=False)
+        # FeedCounter records all sections of a frame in section order, like the per-section counters did
+        print(f"{num_sections:8d} {legacy_ms:23.2f} {feed_ms:21.2f} {len(legacy_events):7d} "
+              f"{str(legacy_events == feed_events == headless_events):>7} {headless_ms:18.2f}")
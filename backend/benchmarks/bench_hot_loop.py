@@ -0,0 +1,101 @@
+# Per-frame allocations and time spent outside the model in the run_tracker hot loop, comparing the legacy
+# path (resize to target, resize again for the preview, JPEG encode, contiguous copy per section, letterbox from
+# target size, tracker on the target frame) with the current one (native frame letterboxed once, tracker on the
+# native frame, preview downscale and JPEG encode only when watched). The JPEG encode of the current path runs in
+# the API process, it is counted here so that both paths do the same work for a watched feed. The tracker update
+# includes the BoT-SORT camera motion compensation, which runs on the frame the tracker is given.
+#
+#   python benchmarks/bench_hot_loop.py --src 1920x1080 --target 1024x576 --sections 3 --frames 200
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from ultralytics.data.augment import LetterBox
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracking import FeedTracker
+
+
+def detections(i, width, height, num_boxes=20, seed=0):
+    # The same people walking across the frame on every path, in the coordinates of the frame the tracker sees
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(0, 1, (num_boxes, 2))
+    speed = rng.uniform(-0.004, 0.004, (num_boxes, 2))
+    centre = (start + speed * i) % 1 * [width, height]
+    size = np.array([0.04 * width, 0.15 * height])
+    dets = np.empty((num_boxes, 6), dtype=np.float32)
+    dets[:, :2] = centre - size / 2
+    dets[:, 2:4] = centre + size / 2
+    dets[:, 4] = 0.8
+    dets[:, 5] = 0
+    return dets
+
+
+def legacy_frame(frame, i, target, sections, letterbox, tracker):
+    im0 = cv2.resize(frame, target)
+    frame_to_send = cv2.resize(im0, (250, 250))
+    letterbox(image=np.ascontiguousarray(im0))
+    tracker.update_detections(detections(i, *target), im0)
+    for _ in range(sections):
+        im0 = np.ascontiguousarray(im0)
+    cv2.imencode(".jpg", frame_to_send)
+
+
+def current_frame(frame, i, target, sections, letterbox, tracker, watched):
+    letterbox(image=frame)
+    tracker.update_detections(detections(i, frame.shape[1], frame.shape[0]), frame)
+    if watched:
+        cv2.imencode(".jpg", cv2.resize(frame, (250, 250)))
+
+
+def measure(fn, frames, n):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    allocated = 0
+    for i in range(n):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(frames[i % len(frames)], i)
+        # Peak over the frame, i.e. the temporaries allocated while processing it
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return 1000 * elapsed / n, allocated / n / 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hot loop allocation benchmark")
+    parser.add_argument("--src", type=str, default="1920x1080")
+    parser.add_argument("--target", type=str, default="1024x576")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--sections", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--tracker", type=str, default="botsort.yaml")
+    args = parser.parse_args()
+
+    src_w, src_h = (int(v) for v in args.src.split("x"))
+    target = tuple(int(v) for v in args.target.split("x"))
+    # Smooth texture shifted a little every frame, so camera motion compensation has features to track
+    texture = cv2.GaussianBlur(np.random.randint(0, 255, (src_h + 32, src_w + 32, 3), dtype=np.uint8), (0, 0), 3)
+    frames = [np.ascontiguousarray(texture[k:k + src_h, k:k + src_w]) for k in range(0, 32, 8)]
+    letterbox = LetterBox(args.imgsz, auto=False)
+
+    runs = [
+        ("legacy", lambda tracker: lambda f, i: legacy_frame(f, i, target, args.sections, letterbox, tracker)),
+        ("current, watched",
+         lambda tracker: lambda f, i: current_frame(f, i, target, args.sections, letterbox, tracker, True)),
+        ("current, headless",
+         lambda tracker: lambda f, i: current_frame(f, i, target, args.sections, letterbox, tracker, False)),
+    ]
+    print(f"{'path':20} {'ms/frame':>9} {'MB allocated/frame':>19}")
+    for name, make_fn in runs:
+        # A fresh tracker per path, with the same track history on every path
+        fn = make_fn(FeedTracker(args.tracker))
+        ms, mb = measure(fn, frames, args.frames)
+        print(f"{name:20} {ms:9.2f} {mb:19.2f}")
@@ -0,0 +1,80 @@
+# Per-frame line crossing cost of a feed with many polyline tripwires, every track tested against every segment
+# against the STRtree indexed PolylineCrossingEngine, with a parity check of the crossing results.
+#
+#   python benchmarks/bench_section_index.py --sections 4 16 64 256 --tracks 50 --frames 200
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_crossing import BACKTRACK_LENGTH, random_walks
+from crossing import PolylineCrossingEngine
+
+
+def make_tripwires(num_sections, width=1280, height=720, seed=0):
+    # Short bent aisle tripwires scattered over the frame, 3 points each
+    rng = np.random.default_rng(seed)
+    tripwires = []
+    for _ in range(num_sections):
+        start = rng.uniform([50, 50], [width - 200, height - 100])
+        middle = start + rng.uniform([40, -40], [90, 40])
+        end = middle + rng.uniform([40, -40], [90, 40])
+        tripwires.append([tuple(start), tuple(middle), tuple(end)])
+    return tripwires
+
+
+def make_chords(num_tracks, num_frames):
+    histories = [[] for _ in range(num_tracks)]
+    frames = []
+    for positions in random_walks(num_tracks, num_frames):
+        starts = []
+        ends = []
+        for track_id, position in enumerate(positions):
+            track_line = histories[track_id]
+            track_line.append(position)
+            if len(track_line) >= BACKTRACK_LENGTH:
+                starts.append(track_line[len(track_line) - BACKTRACK_LENGTH - 1])
+                ends.append(track_line[len(track_line) - 1])
+        frames.append((starts, ends))
+    return frames
+
+
+def run(engine, frames, num_sections):
+    # Tripwire sections: entry and exit on the same polyline, armed from the start
+    lines = np.arange(num_sections) * 2
+    flags = np.zeros((len(frames[-1][0]), num_sections, 4), dtype=bool)
+    flags[:, :, 2:] = True
+    results = []
+    start = time.perf_counter()
+    for starts, ends in frames:
+        if not starts:
+            continue
+        track_flags = flags[:len(starts)]
+        entries, exits, _, _, _ = engine.step(starts, ends, track_flags[:, :, 0], track_flags[:, :, 1],
+                                              track_flags[:, :, 2], track_flags[:, :, 3], lines, lines)
+        track_flags[:, :, 0] |= entries
+        track_flags[:, :, 1] |= exits
+        results.append((np.flatnonzero(entries).tolist(), np.flatnonzero(exits).tolist()))
+    return 1000 * (time.perf_counter() - start) / len(frames), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Section index benchmark")
+    parser.add_argument("--sections", type=int, nargs="+", default=[4, 16, 64, 256])
+    parser.add_argument("--tracks", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    frames = make_chords(args.tracks, args.frames)
+    print(f"{'sections':>8} {'dense ms/frame':>15} {'indexed ms/frame':>17} {'crossings':>10} {'parity':>7}")
+    for num_sections in args.sections:
+        tripwires = make_tripwires(num_sections)
+        polylines = [line for tripwire in tripwires for line in (tripwire, tripwire)]
+        dense_ms, dense = run(PolylineCrossingEngine(polylines, indexed=False), frames, num_sections)
+        indexed_ms, indexed = run(PolylineCrossingEngine(polylines), frames, num_sections)
+        crossings = sum(len(entries) + len(exits) for entries, exits in dense)
+        print(f"{num_sections:8d} {dense_ms:15.3f} {indexed_ms:17.3f} {crossings:10d} {str(dense == indexed):>7}")
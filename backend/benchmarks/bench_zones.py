@@ -0,0 +1,65 @@
+# Per-frame zone membership cost of shapely Polygon.contains per track and zone (as counter.py does it) against one
+# ZoneMask lookup for all tracks, with the share of memberships that differ (points within a mask pixel of a border).
+#
+#   python benchmarks/bench_zones.py --zones 1 8 32 128 --tracks 50 --frames 100
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from shapely.geometry import Point, Polygon
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_crossing import random_walks
+from zones import ZoneMask
+
+
+def make_zones(num_zones, width=1280, height=720, seed=0):
+    # Convex hexagons of various sizes inside the frame, overlapping
+    rng = np.random.default_rng(seed)
+    zones = []
+    for _ in range(num_zones):
+        centre = rng.uniform([100, 100], [width - 100, height - 100])
+        radius = rng.uniform(40, min(200, centre[0], centre[1], width - centre[0], height - centre[1]))
+        angles = np.linspace(0, 2 * np.pi, 6, endpoint=False) + rng.uniform(0, np.pi)
+        zones.append([(float(centre[0] + radius * np.cos(a)), float(centre[1] + radius * np.sin(a))) for a in angles])
+    return zones
+
+
+def run_shapely(zones, frames):
+    polygons = [Polygon(zone) for zone in zones]
+    results = []
+    start = time.perf_counter()
+    for positions in frames:
+        results.append(np.array([[polygon.contains(Point(position)) for polygon in polygons] for position in positions]))
+    return 1000 * (time.perf_counter() - start) / len(frames), results
+
+
+def run_mask(zones, frames, scale):
+    mask = ZoneMask(zones, 1280, 720, scale=scale)
+    results = []
+    start = time.perf_counter()
+    for positions in frames:
+        positions = np.asarray(positions)
+        results.append(mask.lookup(positions[:, 0], positions[:, 1]))
+    return 1000 * (time.perf_counter() - start) / len(frames), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zone membership benchmark")
+    parser.add_argument("--zones", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--tracks", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--scale", type=float, default=0.5)
+    args = parser.parse_args()
+
+    frames = random_walks(args.tracks, args.frames)
+    print(f"{'zones':>6} {'shapely ms/frame':>17} {'mask ms/frame':>14} {'differing':>10}")
+    for num_zones in args.zones:
+        zones = make_zones(num_zones)
+        shapely_ms, expected = run_shapely(zones, frames)
+        mask_ms, found = run_mask(zones, frames, args.scale)
+        differing = sum(int((e != f).sum()) for e, f in zip(expected, found)) / max(1, sum(int(e.sum()) for e in expected))
+        print(f"{num_zones:6d} {shapely_ms:17.3f} {mask_ms:14.3f} {differing:10.2%}")
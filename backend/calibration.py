@@ -0,0 +1,97 @@
+import json
+
+import cv2
+import numpy as np
+
+from detectors import create_detector
+
+IMGSZ_CHOICES = (320, 384, 448, 512, 576, 640, 768, 896, 1024, 1280)
+CALIBRATION_IMGSZ = 1280
+
+
+def select_imgsz(heights, frame_width, frame_height, min_person_height=40, percentile=10, choices=IMGSZ_CHOICES):
+    """
+    Smallest inference size at which the percentile-th smallest person is still min_person_height pixels tall.
+    The model letterboxes the longest frame side to imgsz (scaling up too), so a person of h pixels becomes
+    h * imgsz / longest.
+    """
+    if len(heights) == 0:
+        return None
+    longest = max(frame_width, frame_height)
+    reference = float(np.percentile(heights, percentile))
+    for imgsz in choices:
+        if reference * imgsz / longest >= min_person_height:
+            return imgsz
+    return choices[-1]
+
+
+def person_size_stats(boxes):
+    """Percentiles of box width and height (in frame pixels) over all the detections of a calibration run."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    widths = boxes[:, 2] - boxes[:, 0]
+    heights = boxes[:, 3] - boxes[:, 1]
+    stats = {"detections": int(len(boxes))}
+    for name, values in (("height", heights), ("width", widths)):
+        if len(values) == 0:
+            continue
+        for p in (5, 10, 50, 90):
+            stats[name + "_p" + str(p)] = round(float(np.percentile(values, p)), 1)
+        stats[name + "_max"] = round(float(values.max()), 1)
+    return stats, heights
+
+
+def calibrate_feed(source, model_name, classes=None, num_frames=100, frame_stride=5, conf=0.4, min_person_height=40,
+                   percentile=10, detector_backend="ultralytics", detector_args=None):
+    """
+    Samples num_frames frames of a feed, detects people at high resolution and returns their size statistics with
+    the inference size recommended for the feed. detector_backend and detector_args (imgsz, int8, data) are those of
+    the feed, so the sizes are measured with the engine that will count it.
+    """
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise ValueError("Could not open " + str(source))
+    detector = create_detector(detector_backend, model_name, **(detector_args or {}))
+    classes = classes if classes is not None else [0]
+
+    boxes = []
+    sampled = 0
+    frame_width = frame_height = 0
+    index = 0
+    try:
+        while sampled < num_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            index += 1
+            if (index - 1) % frame_stride:
+                continue
+            frame_height, frame_width = frame.shape[:2]
+            dets = detector.detect([frame], imgsz=CALIBRATION_IMGSZ, conf=conf, classes=classes)[0]
+            boxes.extend(dets[:, :4].tolist())
+            sampled += 1
+    finally:
+        cap.release()
+
+    stats, heights = person_size_stats(boxes)
+    stats.update({"frames": sampled, "frame_width": frame_width, "frame_height": frame_height,
+                  "min_person_height": min_person_height, "percentile": percentile})
+    stats["imgsz"] = select_imgsz(heights, frame_width, frame_height, min_person_height, percentile)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure person sizes in a video and pick an inference size")
+    parser.add_argument("source", type=str)
+    parser.add_argument("--model", type=str, default="yolov8n.pt")
+    parser.add_argument("--backend", type=str, default="ultralytics", choices=("ultralytics", "onnx", "openvino"))
+    parser.add_argument("--imgsz", type=int, default=640, help="Export size of the onnx and openvino models")
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--stride", type=int, default=5)
+    parser.add_argument("--min-person-height", type=int, default=40)
+    args = parser.parse_args()
+    print(json.dumps(calibrate_feed(args.source, args.model, num_frames=args.frames, frame_stride=args.stride,
+                                    min_person_height=args.min_person_height, detector_backend=args.backend,
+                                    detector_args={"imgsz": args.imgsz, "int8": args.int8}), indent=2))
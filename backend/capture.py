@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from ffmpeg_capture import FFmpegCapture
+
+SKIPPED = object()
+READY = object()
+STREAM_PREFIXES = ("rtsp://", "rtsps://", "rtmp://", "http://", "https://", "udp://", "tcp://")
+
+
+def is_stream_source(source):
+    source = str(source)
+    return source.startswith(STREAM_PREFIXES) or source.isdigit() or not os.path.exists(source)
+
+
+def open_capture(source, backend="opencv", width=None, height=None, fps=None):
+    """Opens a source with the configured decoder, "ffmpeg" scales and decimates inside an ffmpeg subprocess."""
+    if backend == "ffmpeg":
+        return FFmpegCapture(source, width, height, fps)
+    return cv2.VideoCapture(source)
+
+
+class Frame:
+    __slots__ = ("seq", "timestamp", "image", "source_msec", "index")
+
+    def __init__(self, seq, timestamp, image, source_msec, index=None):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.image = image
+        self.source_msec = source_msec
+        # Index of the frame in the source (CAP_PROP_POS_FRAMES for files), seq only counts the kept frames
+        self.index = seq if index is None else index
+
+
+class FrameRing:
+    """
+    Small bounded ring of sequenced frames shared by the capture thread (producer) and the tracker (consumer).
+
+    In live mode the oldest unread frame is overwritten when the ring is full (and counted as dropped), in
+    blocking mode the producer waits for room instead so that no frame is ever lost.
+    """
+
+    def __init__(self, size=4):
+        self.frames = deque(maxlen=size)
+        self.size = size
+        self.cond = threading.Condition()
+        self.read_seq = -1
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, frame, block=False):
+        with self.cond:
+            if block:
+                while len(self.frames) == self.size and self.frames[0].seq > self.read_seq and not self.closed:
+                    self.cond.wait(0.5)
+            if len(self.frames) == self.size and self.frames[0].seq > self.read_seq:
+                self.dropped += 1
+            self.frames.append(frame)
+            self.cond.notify_all()
+
+    def next_frame(self, after_seq, timeout=None, latest=False):
+        """
+        Blocks until a frame newer than after_seq is available. Returns the oldest such frame, or the newest one
+        when latest is set (live consumers that want the freshest image). Returns None on timeout or close.
+        """
+        with self.cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                newer = [frame for frame in self.frames if frame.seq > after_seq]
+                if newer:
+                    frame = newer[-1] if latest else newer[0]
+                    # Everything up to this frame is consumed (frames skipped over by latest are dropped)
+                    if latest:
+                        self.dropped += len(newer) - 1
+                    self.read_seq = frame.seq
+                    self.cond.notify_all()
+                    return frame
+                if self.closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class CaptureThread(threading.Thread):
+    """
+    Reads frames from a video file or stream into a FrameRing.
+
+    Every frame gets a sequence number and a capture timestamp, so consumers only ever process new frames.
+    Files are read without drops, either paced at the source fps ("source_fps") or as fast as the consumer
+    keeps up ("max_speed"). Streams are read live and reconnected with exponential backoff when they fail.
+
+    Frames that will not be processed, above target_fps or not on the frame_stride (set by the load controller),
+    are only grabbed: the decoder advances but the image is never retrieved, which is where the decode cost is.
+    """
+
+    def __init__(self, source, capture=None, ring_size=4, pacing="source_fps", reconnect_max_delay=30,
+                 open_fn=None, target_fps=None, name='CaptureThread'):
+        super(CaptureThread, self).__init__(name=name, daemon=True)
+        self.source = source
+        self.open_fn = open_fn if open_fn is not None else (lambda: cv2.VideoCapture(source))
+        self.capture = capture if capture is not None else self.open_fn()
+        self.is_stream = is_stream_source(source)
+        self.pacing = pacing
+        self.ring = FrameRing(ring_size)
+        self.reconnect_max_delay = reconnect_max_delay
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 0
+        self.target_fps = target_fps if target_fps and (not self.fps or target_fps < self.fps) else None
+        self.frame_stride = 1
+
+        self.start_time = None
+        self.last_msec = None
+        self.next_due = 0.0
+        self.candidates = 0
+
+        self.seq = -1
+        self.grabbed = 0
+        self.skipped = 0
+        self.decoded = 0
+        self.duplicates = 0
+        self.reconnects = 0
+        self.finished = False
+        self.running = True
+
+    def _reconnect(self):
+        delay = 1
+        while self.running:
+            print("Capture lost for", self.source, ", reconnecting in", delay, "s")
+            time.sleep(delay)
+            self.capture.release()
+            self.capture = self.open_fn()
+            if self.capture.isOpened():
+                self.reconnects += 1
+                print("Reconnected to", self.source)
+                return True
+            delay = min(delay * 2, self.reconnect_max_delay)
+        return False
+
+    def _keep(self, source_msec, start_time):
+        # Target fps schedule on the source clock (files) or the wall clock (streams), then the load stride
+        if self.target_fps:
+            now = source_msec / 1000.0 if not self.is_stream and source_msec > 0 else time.monotonic() - start_time
+            if now < self.next_due:
+                return False
+            self.next_due += 1.0 / self.target_fps
+            if self.next_due <= now:
+                self.next_due = now + 1.0 / self.target_fps
+        self.candidates += 1
+        return (self.candidates - 1) % max(1, self.frame_stride) == 0
+
+    def grab_next(self):
+        """
+        Grabs the next frame of the source without decoding it. Returns READY when the frame is to be processed
+        (retrieve_frame() decodes it), SKIPPED when it is dropped (duplicate, above target fps, off stride,
+        reconnected), or None once the source has ended. Blocks on the source, and on the reconnect backoff of
+        streams.
+        """
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+        ret = self.capture.grab() if self.capture.isOpened() else False
+        if not ret:
+            if self.is_stream and self._reconnect():
+                self.last_msec = None
+                return SKIPPED
+            return None
+
+        self.grabbed += 1
+        source_msec = self.capture.get(cv2.CAP_PROP_POS_MSEC)
+        # Some cameras resend the previous frame, it carries the same timestamp and is not worth processing
+        if self.last_msec is not None and source_msec > 0 and source_msec == self.last_msec:
+            self.duplicates += 1
+            return SKIPPED
+        self.last_msec = source_msec
+
+        if not self._keep(source_msec, self.start_time):
+            self.skipped += 1
+            return SKIPPED
+        return READY
+
+    def retrieve_frame(self):
+        # Decodes the frame grab_next() returned READY for, SKIPPED if the decoder fails on it
+        ret, image = self.capture.retrieve()
+        if not ret:
+            return SKIPPED
+        self.decoded += 1
+        self.seq += 1
+        return Frame(self.seq, time.time(), image, self.last_msec, self.grabbed - 1)
+
+    def read_next(self):
+        """Grabs and decodes the next frame to process. Returns a Frame, SKIPPED or None as grab_next()."""
+        result = self.grab_next()
+        if result is not READY:
+            return result
+        return self.retrieve_frame()
+
+    def pacing_delay(self):
+        # Time until the last grabbed frame is due when files are played back at their own fps
+        if self.is_stream or self.pacing != "source_fps" or self.fps <= 0:
+            return 0
+        return max(0, self.start_time + self.grabbed / self.fps - time.monotonic())
+
+    def run(self):
+        while self.running:
+            frame = self.read_next()
+            if frame is None:
+                break
+            if frame is SKIPPED:
+                continue
+            delay = self.pacing_delay()
+            if delay > 0:
+                time.sleep(delay)
+            self.ring.put(frame, block=not self.is_stream)
+
+        self.finished = True
+        self.ring.close()
+
+    def next_frame(self, after_seq, timeout=None):
+        # Live streams always hand out the freshest frame, files hand out every frame in order
+        return self.ring.next_frame(after_seq, timeout, latest=self.is_stream)
+
+    def counters(self):
+        return {"grabbed_frames": self.grabbed, "decoded_frames": self.decoded, "skipped_frames": self.skipped,
+                "dropped_frames": self.ring.dropped,
+                "duplicate_frames": self.duplicates, "reconnects": self.reconnects}
+
+    def stop(self):
+        self.running = False
+        self.ring.close()
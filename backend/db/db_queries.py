@@ -1,10 +1,12 @@
 from .db_service import DBService
+from .global_ids import GlobalIdAllocator
 from .schema import *
 
 class DBQueries:
 
     def __init__(self):
         self.db = DBService()
+        self.ids = None
 
     def get_sections(self, feed_id):
         return self.db.dispatch(SectionMaster, 'query', SectionMaster.feed_id == feed_id)
@@ -33,8 +35,12 @@ class DBQueries:
         self.db.dispatch(SectionMaster, 'add', section)
 
     def new_global_id(self, camera_id, feed_id, section_id, frame_count, added_at, modified_at):
+        # Ids come from the same reserved blocks as the EventWriter ones, never from the serial of the table
+        if self.ids is None:
+            self.ids = GlobalIdAllocator(self.db.get_engine())
         with self.db.get_session() as session:
             global_id = GlobalIdMaster(
+                id=self.ids.next(),
                 camera_id=camera_id,
                 feed_id=feed_id,
                 section_id=section_id,
@@ -60,4 +66,10 @@ class DBQueries:
             added_at=added_at,
             frame_count=frame
         )
-        self.db.dispatch(DetectionData, 'add', entry_exit)
\ No newline at end of file
+        self.db.dispatch(DetectionData, 'add', entry_exit)
+
+    def record_event(self, camera_id, feed_id, section_id, detection_time, attribute, frame):
+        # Synchronous version of EventWriter.record_event, two round-trips per event
+        global_id = self.new_global_id(camera_id, feed_id, section_id, frame, detection_time, detection_time)
+        self.record_entry_exit(feed_id, section_id, global_id, detection_time, attribute, detection_time, frame)
+        return global_id
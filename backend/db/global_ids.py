@@ -0,0 +1,74 @@
+import threading
+import time
+
+from sqlalchemy import text
+
+GLOBAL_ID_SEQUENCE = "global_id_block_seq"
+
+
+class GlobalIdAllocator:
+    """
+    Hands out global ids from blocks reserved in the database. global_id_block_seq increments by the block size,
+    so one nextval reserves a whole block for this process and ids are then assigned locally. The first block is
+    reserved when the allocator is created and the next one is fetched in the background once the current block
+    runs low, so next() only waits on the database if the prefetch could not keep up (or the database is down).
+    Ids of a block that is not used up before the process exits are simply skipped.
+    """
+
+    def __init__(self, engine, low_water=0.2):
+        self.engine = engine
+        self.low_water = low_water
+        self.lock = threading.Lock()
+        self.refilled = threading.Condition(self.lock)
+        self.block_size = None
+        self.spare = None
+        self.prefetching = False
+        self.next_id, self.end = self._reserve()
+        self.blocks = 1
+
+    def _reserve(self):
+        with self.engine.begin() as connection:
+            if self.block_size is None:
+                self.block_size = connection.execute(
+                    text("SELECT increment_by FROM pg_sequences WHERE sequencename = :name"),
+                    {"name": GLOBAL_ID_SEQUENCE}).scalar()
+            start = connection.execute(text(f"SELECT nextval('{GLOBAL_ID_SEQUENCE}')")).scalar()
+        return start, start + self.block_size
+
+    def _prefetch(self):
+        # Runs without the lock, callers of next() only wait for the block if they ran out
+        try:
+            block = self._reserve()
+        except Exception as e:
+            print("Reserving a block of global ids failed:", e)
+            block = None
+            time.sleep(1)
+        with self.lock:
+            if block is not None:
+                self.spare = block
+                self.blocks += 1
+            self.prefetching = False
+            self.refilled.notify_all()
+
+    def _start_prefetch(self):
+        self.prefetching = True
+        threading.Thread(target=self._prefetch, name="GlobalIdPrefetch", daemon=True).start()
+
+    def next(self):
+        with self.lock:
+            while self.next_id >= self.end:
+                if self.spare is not None:
+                    self.next_id, self.end = self.spare
+                    self.spare = None
+                    break
+                # Exhausted: wait for the block in flight, or fetch one (again, after a failure)
+                if not self.prefetching:
+                    self._start_prefetch()
+                self.refilled.wait()
+
+            global_id = self.next_id
+            self.next_id += 1
+            if (self.spare is None and not self.prefetching
+                    and self.end - self.next_id < self.low_water * self.block_size):
+                self._start_prefetch()
+            return global_id
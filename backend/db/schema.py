@@ -9,6 +9,8 @@ from pgvector.sqlalchemy import Vector
 
 Base = declarative_base()
 
+GLOBAL_ID_BLOCK_SIZE = 1000
+
 class CameraMaster(Base):
     __tablename__ = 'camera_master'
 
@@ -104,6 +106,8 @@ class DetectionData(Base):
     attribute = Column(String)
     added_at = Column(TIMESTAMP)
     frame_count = Column(Integer)
+    # Set by the event writer, makes retried inserts of the same event a no-op
+    event_key = Column(String, unique=True)
 
     # Define the relationships with the FeedMaster, SectionMaster, and GlobalIdMaster tables
     feed = relationship("FeedMaster")
@@ -172,6 +176,24 @@ Base.metadata.bind = engine
 # Create the tables based on the defined models if they don't already exist
 Base.metadata.create_all(engine)
 
+# Columns added after the first release, create_all does not alter existing tables
+with engine.connect() as connection:
+    trans = connection.begin()
+    connection.execute(text("ALTER TABLE detection_data ADD COLUMN IF NOT EXISTS event_key VARCHAR;"))
+    connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS detection_data_event_key_key ON detection_data (event_key);"))
+    # Global ids are reserved by workers in blocks of GLOBAL_ID_BLOCK_SIZE (see db/global_ids.py). The sequence
+    # starts past the ids already in use when it is first created.
+    connection.execute(text(f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_class WHERE relkind = 'S' AND relname = 'global_id_block_seq') THEN
+                EXECUTE format('CREATE SEQUENCE global_id_block_seq INCREMENT BY {GLOBAL_ID_BLOCK_SIZE} START WITH %s',
+                               (SELECT COALESCE(MAX(id), 0) + 1 FROM global_id_master));
+            END IF;
+        END $$;
+    """))
+    trans.commit()
+
 # Create table triggers
 with engine.connect() as connection:
     # Create the database
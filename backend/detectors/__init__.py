@@ -0,0 +1,43 @@
+from .base import Detector, filter_detections
+from .keyframe import KeyframeDetector
+from .replay_backend import DetectionRecorder, ReplayDetector
+from .ultralytics_backend import UltralyticsDetector, export_model
+
+DETECTOR_BACKENDS = ("ultralytics", "onnx", "openvino", "replay")
+
+
+def create_detector(backend, model_name, tracker="botsort.yaml", fps=30, imgsz=640, int8=False, data=None,
+                    replay_path=None, record_path=None, detect_interval=1):
+    if backend == "ultralytics":
+        detector = UltralyticsDetector(model_name, tracker, fps)
+    elif backend in ("onnx", "openvino"):
+        detector = UltralyticsDetector(export_model(model_name, backend, imgsz, int8, data), tracker, fps)
+    elif backend == "replay":
+        if not replay_path:
+            raise ValueError("The replay detector backend needs a replay_path, it runs in local inference mode only")
+        detector = ReplayDetector(replay_path, tracker, fps)
+    else:
+        raise ValueError(f"Unknown detector backend: {backend}, expected one of {DETECTOR_BACKENDS}")
+
+    if record_path:
+        detector = DetectionRecorder(detector, record_path, tracker, fps)
+    if detect_interval > 1:
+        detector = KeyframeDetector(detector, detect_interval, tracker, fps)
+    return detector
+
+
+def worker_key(backend, model_name, detector_args):
+    # Feeds share a loaded model only if every argument it was created with is the same
+    return ":".join([backend, str(model_name)] + [f"{k}={v}" for k, v in sorted(detector_args.items())])
+
+
+def load_detector(config, fps=30):
+    """Creates the detector described by a feed config (detector_backend, model_name, ...)."""
+    return create_detector(str(config.get("detector_backend", "ultralytics")), config.get("model_name"),
+                           tracker=str(config.get("tracker", "botsort.yaml")), fps=fps,
+                           imgsz=int(config.get("imgsz", 640)),
+                           int8=str(config.get("detector_int8", "false")).lower() == "true",
+                           data=config.get("int8_calibration_data"),
+                           replay_path=config.get("replay_path"),
+                           record_path=config.get("record_detections"),
+                           detect_interval=int(config.get("detect_interval", 1)))
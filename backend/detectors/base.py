@@ -0,0 +1,41 @@
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from tracking import FeedTracker
+
+
+class Detector:
+    """
+    Common interface of all detector backends.
+
+    detect() takes a list of BGR frames and returns one (N, 6) float32 array of [x1, y1, x2, y2, conf, cls] per
+    frame, in frame coordinates. track() mirrors YOLO.track(persist=True) and returns a list with one ultralytics
+    Results object carrying track ids, so the counting code does not care which backend produced it.
+    """
+
+    names = {}
+
+    def __init__(self, tracker="botsort.yaml", fps=30):
+        self.tracker_cfg = tracker
+        self.fps = fps
+        self.tracker = None
+
+    def detect(self, frames, imgsz=640, conf=0.25, classes=None):
+        raise NotImplementedError
+
+    def track(self, source, persist=True, show=False, verbose=False, classes=None, conf=0.25, imgsz=640, **kwargs):
+        if self.tracker is None or not persist:
+            self.tracker = FeedTracker(self.tracker_cfg, frame_rate=self.fps)
+        dets = self.detect([source], imgsz=imgsz, conf=conf, classes=classes)[0]
+        tracks = self.tracker.update_detections(dets, source)
+        return [Results(orig_img=source, path="", names=self.names, boxes=torch.as_tensor(tracks))]
+
+
+def filter_detections(dets, conf=None, classes=None):
+    keep = np.ones(len(dets), dtype=bool)
+    if conf is not None:
+        keep &= dets[:, 4] >= conf
+    if classes is not None:
+        keep &= np.isin(dets[:, 5], classes)
+    return dets[keep]
@@ -0,0 +1,45 @@
+import torch
+from ultralytics.engine.results import Results
+
+from sort_tracker import SortTracker
+
+from .base import Detector
+
+
+class KeyframeDetector(Detector):
+    """
+    Runs the wrapped detector only every detect_interval frames and lets a SortTracker predict the tracks on the
+    frames in between, so the detector cost is divided by detect_interval.
+    """
+
+    def __init__(self, detector, detect_interval=6, tracker="botsort.yaml", fps=30, max_age=3):
+        super(KeyframeDetector, self).__init__(tracker, fps)
+        self.detector = detector
+        self.names = detector.names
+        self.detect_interval = max(1, int(detect_interval))
+        self.max_age = max_age
+        self.sort = SortTracker(max_age=max_age)
+        self.frame_index = 0
+        self.detected_frames = 0
+        self.predicted_frames = 0
+
+    def detect(self, frames, imgsz=640, conf=0.25, classes=None):
+        return self.detector.detect(frames, imgsz=imgsz, conf=conf, classes=classes)
+
+    def track(self, source, persist=True, show=False, verbose=False, classes=None, conf=0.25, imgsz=640, **kwargs):
+        if not persist:
+            self.sort.reset()
+            self.frame_index = 0
+
+        if self.frame_index % self.detect_interval == 0:
+            dets = self.detect([source], imgsz=imgsz, conf=conf, classes=classes)[0]
+            tracks = self.sort.update(dets)
+            self.detected_frames += 1
+        else:
+            tracks = self.sort.predict()
+            self.predicted_frames += 1
+        self.frame_index += 1
+        return [Results(orig_img=source, path="", names=self.names, boxes=torch.as_tensor(tracks))]
+
+    def counters(self):
+        return {"detected_frames": self.detected_frames, "predicted_frames": self.predicted_frames}
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+from ultralytics import YOLO
+
+from tracking import fit_gmc
+
+from .base import Detector
+
+
+def export_model(model_name, fmt, imgsz=640, int8=False, data=None):
+    """
+    Exports a PyTorch YOLO model for CPU inference, once: the exported file is reused if it already exists.
+    ONNX int8 uses onnxruntime dynamic quantisation, OpenVINO int8 uses the ultralytics NNCF export.
+    """
+    stem = os.path.splitext(model_name)[0]
+    if fmt == "onnx":
+        path = stem + ".onnx"
+        if not os.path.exists(path):
+            path = YOLO(model_name).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if not int8:
+            return path
+        quantized = stem + "_int8.onnx"
+        if not os.path.exists(quantized):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(path, quantized, weight_type=QuantType.QInt8)
+        return quantized
+
+    if fmt == "openvino":
+        path = stem + ("_int8" if int8 else "") + "_openvino_model"
+        if not os.path.exists(path):
+            kwargs = {"int8": True, "data": data or "coco8.yaml"} if int8 else {}
+            exported = YOLO(model_name).export(format="openvino", imgsz=imgsz, **kwargs)
+            if exported != path:
+                os.rename(exported, path)
+        return path
+
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+class UltralyticsDetector(Detector):
+    """
+    Any model the ultralytics AutoBackend can run: PyTorch weights, or an exported ONNX Runtime / OpenVINO model.
+    Tracking goes through model.track so the behaviour is the same as before backends existed.
+    """
+
+    def __init__(self, model_name, tracker="botsort.yaml", fps=30):
+        super(UltralyticsDetector, self).__init__(tracker, fps)
+        self.model_name = model_name
+        self.model = YOLO(model_name, task="detect")
+        self.names = self.model.names
+
+    def detect(self, frames, imgsz=640, conf=0.25, classes=None):
+        results = self.model.predict(frames, imgsz=imgsz, conf=conf, classes=classes, verbose=False)
+        return [result.boxes.data.cpu().numpy().astype(np.float32) for result in results]
+
+    def track(self, source, persist=True, show=False, verbose=False, classes=None, conf=0.25, imgsz=640, **kwargs):
+        results = self.model.track(source, persist=persist, show=show, verbose=verbose, classes=classes, conf=conf,
+                                   imgsz=imgsz, tracker=self.tracker_cfg, **kwargs)
+        # Native frames go to the tracker, keep its motion compensation at the cost it had on target-size frames
+        if hasattr(source, "shape"):
+            for tracker in getattr(self.model.predictor, "trackers", None) or []:
+                fit_gmc(tracker, source.shape[1])
+        return results
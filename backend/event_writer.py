@@ -0,0 +1,115 @@
+import threading
+import time
+import uuid
+
+from sqlalchemy.dialects.postgresql import insert
+
+from db.global_ids import GlobalIdAllocator
+from db.schema import DetectionData, GlobalIdMaster
+from pipeline import STOP, StageQueue
+
+
+class EventWriter(threading.Thread):
+    """
+    Entry/exit events are queued by the counters and written to the database by this thread, so a burst of
+    crossings never waits on the database inside the counting loop.
+
+    Global ids are assigned locally when an event is recorded, from blocks reserved by a GlobalIdAllocator. Events
+    are flushed in one transaction per batch, when batch_size events are pending or flush_interval seconds after the
+    first one, with a single multi-row insert into global_id_master and one into detection_data. Every event carries
+    an event_key and both inserts skip rows that already exist, so a batch is retried until it succeeds without ever
+    writing an event twice. The queue holds max_queue events, past that record_event blocks instead of losing counts.
+    """
+
+    def __init__(self, engine, batch_size=200, flush_interval=1.0, max_queue=10000, smoothing=0.1, ids=None):
+        super(EventWriter, self).__init__(name="EventWriter", daemon=True)
+        self.engine = engine
+        self.ids = ids or GlobalIdAllocator(engine)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = StageQueue(max_queue, drop_oldest=False)
+        self.smoothing = smoothing
+        self.flush_ms = 0.0
+        self.written = 0
+        self.failed_flushes = 0
+        self.stopping = False
+
+    def record_event(self, camera_id, feed_id, section_id, detection_time, attribute, frame):
+        global_id = self.ids.next()
+        self.queue.put({
+            "event_key": uuid.uuid4().hex,
+            "global_id": global_id,
+            "camera_id": camera_id,
+            "feed_id": feed_id,
+            "section_id": section_id,
+            "detection_time": detection_time,
+            "attribute": attribute,
+            "frame_count": frame,
+        })
+        return global_id
+
+    def run(self):
+        batch = []
+        deadline = 0
+        while True:
+            item = self.queue.get(timeout=max(0, deadline - time.monotonic()) if batch else self.flush_interval)
+            if item is not None and item is not STOP:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+            if batch and (item is STOP or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self.flush_with_retry(batch)
+                batch = []
+            if item is STOP:
+                break
+
+    def flush_with_retry(self, batch):
+        delay = 0.5
+        attempts = 0
+        while True:
+            try:
+                self.flush(batch)
+                return
+            except Exception as e:
+                self.failed_flushes += 1
+                attempts += 1
+                print("Writing", len(batch), "events failed:", e)
+                if self.stopping and attempts >= 3:
+                    print("Giving up on", len(batch), "events")
+                    return
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def flush(self, batch):
+        start = time.perf_counter()
+        with self.engine.begin() as connection:
+            connection.execute(insert(GlobalIdMaster).values([
+                {"id": event["global_id"], "camera_id": event["camera_id"], "feed_id": event["feed_id"],
+                 "section_id": event["section_id"], "frame_count": event["frame_count"],
+                 "added_at": event["detection_time"], "modified_at": event["detection_time"]}
+                for event in batch]).on_conflict_do_nothing(index_elements=["id"]))
+            connection.execute(insert(DetectionData).values([
+                {"feed_id": event["feed_id"], "section_id": event["section_id"], "global_id": event["global_id"],
+                 "detection_time": event["detection_time"], "attribute": event["attribute"],
+                 "added_at": event["detection_time"], "frame_count": event["frame_count"],
+                 "event_key": event["event_key"]}
+                for event in batch]).on_conflict_do_nothing(index_elements=["event_key"]))
+
+        latency = (time.perf_counter() - start) * 1000
+        self.flush_ms = latency if not self.written else (1 - self.smoothing) * self.flush_ms + self.smoothing * latency
+        self.written += len(batch)
+
+    def stop(self, timeout=10):
+        # Flushes what is queued, retrying a failing batch a few times only
+        self.stopping = True
+        self.queue.put(STOP)
+        self.join(timeout)
+
+    def metrics(self):
+        return {
+            "event_queue_depth": len(self.queue),
+            "event_flush_ms": round(self.flush_ms, 2),
+            "events_written": self.written,
+            "event_flush_failures": self.failed_flushes,
+            "global_id_blocks": self.ids.blocks,
+        }
@@ -0,0 +1,148 @@
+import json
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+FFMPEG_BIN = os.environ.get("AVIAN_FFMPEG", "ffmpeg")
+FFPROBE_BIN = os.environ.get("AVIAN_FFPROBE", "ffprobe")
+
+
+def _parse_rate(rate):
+    try:
+        num, den = rate.split("/")
+        return float(num) / float(den) if float(den) else 0.0
+    except (ValueError, AttributeError):
+        return 0.0
+
+
+def probe_source(source):
+    """Returns (width, height, fps, frame_count) of a source, using ffprobe when available and OpenCV otherwise."""
+    if shutil.which(FFPROBE_BIN):
+        cmd = [FFPROBE_BIN, "-v", "error", "-select_streams", "v:0", "-show_entries",
+               "stream=width,height,avg_frame_rate,r_frame_rate,nb_frames", "-of", "json", str(source)]
+        try:
+            output = subprocess.run(cmd, capture_output=True, timeout=30, check=True).stdout
+            stream = json.loads(output)["streams"][0]
+            fps = _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate"))
+            frame_count = int(stream.get("nb_frames", 0) or 0)
+            return int(stream["width"]), int(stream["height"]), fps, frame_count
+        except (subprocess.SubprocessError, ValueError, KeyError, IndexError) as e:
+            print("ffprobe failed for", source, ":", e)
+
+    cap = cv2.VideoCapture(source)
+    try:
+        return (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
+
+
+class FFmpegCapture:
+    """
+    cv2.VideoCapture compatible reader backed by an ffmpeg subprocess.
+
+    Scaling to width x height and frame rate decimation happen inside ffmpeg, so Python only ever sees the
+    pixels it is going to use. Each frame is read straight from the pipe into its own numpy array (no
+    intermediate bytes object), arrays are not reused since consumers may still hold on to earlier frames.
+    """
+
+    def __init__(self, source, width=None, height=None, fps=None):
+        self.source = source
+        self.src_width, self.src_height, self.src_fps, self.src_frame_count = probe_source(source)
+        self.width = int(width or self.src_width)
+        self.height = int(height or self.src_height)
+        self.fps = float(fps) if fps else self.src_fps
+        self.frame_size = self.width * self.height * 3
+        self.frame_index = 0
+        self.grabbed = None
+        self.proc = None
+        self.eof = False
+
+        if not self.src_width or not self.src_height:
+            print("Could not probe", source)
+            return
+
+        cmd = [FFMPEG_BIN, "-nostdin", "-loglevel", "error"]
+        if str(source).startswith("rtsp"):
+            cmd += ["-rtsp_transport", "tcp"]
+        filters = []
+        if fps:
+            filters.append("fps=" + str(fps))
+        if (self.width, self.height) != (self.src_width, self.src_height):
+            filters.append("scale=" + str(self.width) + ":" + str(self.height))
+        cmd += ["-i", str(source)]
+        if filters:
+            cmd += ["-vf", ",".join(filters)]
+        cmd += ["-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=self.frame_size)
+
+    def isOpened(self):
+        # The pipe may still hold frames after ffmpeg exits, so only end of stream closes the capture
+        return self.proc is not None and not self.eof
+
+    def _read_frame(self):
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        view = memoryview(frame).cast("B")
+        filled = 0
+        while filled < self.frame_size:
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                self.eof = True
+                return None
+            filled += n
+        return frame
+
+    def grab(self):
+        if self.proc is None:
+            return False
+        self.grabbed = self._read_frame()
+        if self.grabbed is None:
+            return False
+        self.frame_index += 1
+        return True
+
+    def retrieve(self):
+        frame, self.grabbed = self.grabbed, None
+        return frame is not None, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            if self.src_fps and self.fps:
+                return int(self.src_frame_count * self.fps / self.src_fps)
+            return self.src_frame_count
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.frame_index
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.frame_index * 1000.0 / self.fps if self.fps else 0
+        return 0
+
+    def set(self, prop, value):
+        # Seeking is not supported on a pipe
+        return False
+
+    def release(self):
+        if self.proc is None:
+            return
+        self.proc.stdout.close()
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
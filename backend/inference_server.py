@@ -0,0 +1,475 @@
+# AVIAN: Shared batched inference server
+# Loads every model once and serves all running feeds. Frames from the feeds are collected into dynamic
+# micro-batches (flushed on max batch size or max latency deadline), while each feed keeps its own tracker
+# so that the tracking state returned to its ObjectCounter is exactly what model.track(persist=True) gives.
+import argparse
+import os
+import secrets
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from detectors import create_detector, filter_detections, worker_key
+from tracking import FeedTracker
+from utils.shm import attach_segment, create_segment
+
+# Feeds connect over a unix socket only the user running the server can open, TCP is only used when a host is set.
+# Connections are authenticated with a per-install secret either way: messages are pickles, whoever can send one
+# can run code in the server.
+INFERENCE_SERVER_SOCKET = os.environ.get("AVIAN_INFERENCE_SOCKET",
+                                         os.path.join(tempfile.gettempdir(), "avian_inference.sock"))
+INFERENCE_SERVER_HOST = os.environ.get("AVIAN_INFERENCE_HOST")
+INFERENCE_SERVER_PORT = int(os.environ.get("AVIAN_INFERENCE_PORT", "6510"))
+INFERENCE_SERVER_KEY_FILE = os.environ.get("AVIAN_INFERENCE_KEY_FILE",
+                                           os.path.join(os.path.expanduser("~"), ".avian", "inference.key"))
+
+MAX_BATCH_SIZE = 16
+MAX_LATENCY_MS = 25
+MAX_PENDING_PER_FEED = 2
+
+# Clients on the same host pass frames through a shared memory slot of their own and only send its name, shape and
+# dtype. The slot is only rewritten once the reply for the previous frame came back, so the server reads it in
+# place. Slot header (64 bytes): magic, writer pid.
+FRAME_SLOT_MAGIC = b"AVIS"
+FRAME_SLOT_HEADER = struct.Struct("<4sI")
+FRAME_SLOT_HEADER_SIZE = 64
+
+
+def inference_server_address(host=INFERENCE_SERVER_HOST, port=INFERENCE_SERVER_PORT):
+    return (host, port) if host else INFERENCE_SERVER_SOCKET
+
+
+def inference_authkey():
+    """The secret shared by the server and its clients, AVIAN_INFERENCE_AUTHKEY or the key file. None if neither."""
+    key = os.environ.get("AVIAN_INFERENCE_AUTHKEY")
+    if key:
+        return key.encode()
+    try:
+        with open(INFERENCE_SERVER_KEY_FILE, "rb") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def create_authkey(path=INFERENCE_SERVER_KEY_FILE):
+    # Random secret readable by the installing user only, kept across restarts
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(secrets.token_hex(32))
+    print("Created inference server key", path)
+
+
+def close_slot(slot):
+    if slot is None:
+        return
+    try:
+        slot.close()
+    except BufferError:
+        # A frame view is still alive somewhere, the mapping goes away with the process
+        pass
+
+
+class InferenceRequest:
+    def __init__(self, feed_id, frame, conf, classes, imgsz):
+        self.feed_id = feed_id
+        self.frame = frame
+        self.conf = conf
+        self.classes = classes
+        self.imgsz = imgsz
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.tracks = None
+        self.dropped = False
+        self.error = None
+
+
+class ModelWorker(threading.Thread):
+    """
+    Owns one loaded model and batches the frames of every feed registered on it.
+
+    Fairness: every feed has its own small pending queue (drop-oldest when full) and batches are filled
+    round-robin across feeds, one frame per feed per round, starting from a rotating feed. A busy feed can
+    therefore never take more than its share of a batch or push out the frames of other feeds.
+    """
+
+    def __init__(self, model_name, backend="ultralytics", max_batch_size=MAX_BATCH_SIZE,
+                 max_latency_ms=MAX_LATENCY_MS, max_pending_per_feed=MAX_PENDING_PER_FEED, **detector_args):
+        super(ModelWorker, self).__init__(name="ModelWorker-" + str(model_name), daemon=True)
+        self.model_name = model_name
+        self.detector = create_detector(backend, model_name, **detector_args)
+        self.names = self.detector.names
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.max_pending_per_feed = max_pending_per_feed
+
+        self.cond = threading.Condition()
+        self.pending = {}
+        self.feed_order = []
+        self.rr_index = 0
+        self.trackers = {}
+
+        self.batches = 0
+        self.frames = 0
+        self.dropped = 0
+
+    def register_feed(self, feed_id, tracker="botsort.yaml", fps=30):
+        with self.cond:
+            self.trackers[feed_id] = FeedTracker(tracker, frame_rate=fps)
+            if feed_id not in self.pending:
+                self.pending[feed_id] = deque()
+                self.feed_order.append(feed_id)
+
+    def unregister_feed(self, feed_id):
+        with self.cond:
+            for request in self.pending.pop(feed_id, []):
+                request.dropped = True
+                request.done.set()
+            if feed_id in self.feed_order:
+                self.feed_order.remove(feed_id)
+            self.trackers.pop(feed_id, None)
+
+    def submit(self, request):
+        with self.cond:
+            queue = self.pending[request.feed_id]
+            if len(queue) >= self.max_pending_per_feed:
+                old = queue.popleft()
+                old.dropped = True
+                old.done.set()
+                self.dropped += 1
+            queue.append(request)
+            self.cond.notify()
+
+    def _pending_count(self):
+        return sum(len(queue) for queue in self.pending.values())
+
+    def _oldest_request(self):
+        heads = [queue[0] for queue in self.pending.values() if queue]
+        return min(heads, key=lambda request: request.created) if heads else None
+
+    def _collect_batch(self):
+        with self.cond:
+            while True:
+                oldest = self._oldest_request()
+                if oldest is None:
+                    self.cond.wait()
+                    continue
+
+                wait_time = oldest.created + self.max_latency - time.monotonic()
+                if self._pending_count() >= self.max_batch_size or wait_time <= 0:
+                    break
+                self.cond.wait(wait_time)
+
+            # Only frames with the same inference size can share a batch, the oldest request decides
+            imgsz = oldest.imgsz
+            batch = []
+            num_feeds = len(self.feed_order)
+            start = self.rr_index % num_feeds
+            self.rr_index += 1
+            while len(batch) < self.max_batch_size:
+                added = False
+                for i in range(num_feeds):
+                    queue = self.pending[self.feed_order[(start + i) % num_feeds]]
+                    if queue and queue[0].imgsz == imgsz and len(batch) < self.max_batch_size:
+                        batch.append(queue.popleft())
+                        added = True
+                if not added:
+                    break
+            return batch
+
+    def _process(self, batch):
+        conf = min(request.conf for request in batch)
+        classes = None
+        if all(request.classes is not None for request in batch):
+            classes = sorted(set(c for request in batch for c in request.classes))
+
+        try:
+            detections = self.detector.detect([request.frame for request in batch], imgsz=batch[0].imgsz, conf=conf,
+                                              classes=classes)
+        except Exception as e:
+            print("Inference failed for model", self.model_name, ":", e)
+            for request in batch:
+                request.error = str(e)
+                request.done.set()
+            return
+
+        # Trackers are updated in batch order, which keeps the frame order of every feed
+        for request, dets in zip(batch, detections):
+            dets = filter_detections(dets, request.conf, request.classes)
+            tracker = self.trackers.get(request.feed_id)
+            if tracker is not None:
+                request.tracks = tracker.update_detections(dets, request.frame)
+            else:
+                request.tracks = np.empty((0, 6), dtype=np.float32)
+            request.done.set()
+
+        self.batches += 1
+        self.frames += len(batch)
+
+    def run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                self._process(batch)
+
+
+class InferenceServer:
+    def __init__(self, authkey, host=INFERENCE_SERVER_HOST, port=INFERENCE_SERVER_PORT, max_batch_size=MAX_BATCH_SIZE,
+                 max_latency_ms=MAX_LATENCY_MS, max_pending_per_feed=MAX_PENDING_PER_FEED):
+        self.address = inference_server_address(host, port)
+        self.authkey = authkey
+        self.max_batch_size = max_batch_size
+        self.max_latency_ms = max_latency_ms
+        self.max_pending_per_feed = max_pending_per_feed
+        self.workers = {}
+        self.workers_lock = threading.Lock()
+
+    def get_worker(self, model_name, backend="ultralytics", **detector_args):
+        with self.workers_lock:
+            key = worker_key(backend, model_name, detector_args)
+            if key not in self.workers:
+                print("Loading model", model_name, "on backend", backend)
+                worker = ModelWorker(model_name, backend, self.max_batch_size, self.max_latency_ms,
+                                     self.max_pending_per_feed, **detector_args)
+                worker.start()
+                self.workers[key] = worker
+            return self.workers[key]
+
+    def handle_connection(self, conn):
+        worker = None
+        feed_id = None
+        slot = None
+        try:
+            while True:
+                message = conn.recv()
+                if message["type"] == "register":
+                    try:
+                        worker = self.get_worker(message["model_name"], message.get("backend", "ultralytics"),
+                                                 **message.get("detector_args", {}))
+                    except ValueError as e:
+                        conn.send({"error": str(e)})
+                        continue
+                    feed_id = message["feed_id"]
+                    worker.register_feed(feed_id, message.get("tracker", "botsort.yaml"), message.get("fps", 30))
+                    print("Feed", feed_id, "registered on model", worker.model_name)
+                    conn.send({"names": worker.names})
+                elif message["type"] == "track":
+                    if worker is None:
+                        conn.send({"tracks": None, "dropped": False, "error": "Feed is not registered"})
+                        continue
+                    frame = message.get("frame")
+                    if "slot" in message:
+                        # A client grows its slot under a new name
+                        if slot is None or slot.name != message["slot"]:
+                            close_slot(slot)
+                            slot = attach_segment(message["slot"])
+                        frame = np.ndarray(message["shape"], dtype=message["dtype"], buffer=slot.buf,
+                                           offset=FRAME_SLOT_HEADER_SIZE)
+                    request = InferenceRequest(feed_id, frame, message["conf"], message["classes"], message["imgsz"])
+                    worker.submit(request)
+                    request.done.wait()
+                    conn.send({"tracks": request.tracks, "dropped": request.dropped, "error": request.error})
+                    frame = request = None
+                elif message["type"] == "stats":
+                    conn.send(self.stats())
+        except (EOFError, ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            if worker is not None and feed_id is not None:
+                worker.unregister_feed(feed_id)
+                print("Feed", feed_id, "disconnected")
+            close_slot(slot)
+            conn.close()
+
+    def stats(self):
+        with self.workers_lock:
+            return {name: {"feeds": len(worker.feed_order), "batches": worker.batches, "frames": worker.frames,
+                           "dropped": worker.dropped,
+                           "avg_batch_size": worker.frames / worker.batches if worker.batches else 0}
+                    for name, worker in self.workers.items()}
+
+    def _listen(self):
+        if not isinstance(self.address, str):
+            return Listener(self.address, authkey=self.authkey)
+        if os.path.exists(self.address):
+            # Left behind by a server that was killed, unless one is still accepting on it
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.address)
+                raise OSError(f"Another inference server is listening on {self.address}")
+            except ConnectionRefusedError:
+                os.unlink(self.address)
+            finally:
+                probe.close()
+        # The socket file is created 0600, there is no window in which another user could connect
+        umask = os.umask(0o177)
+        try:
+            return Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+
+    def serve_forever(self):
+        listener = self._listen()
+        print("Inference server listening on", self.address)
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print("Failed to accept connection:", e)
+                continue
+            threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+
+
+class InferenceClient:
+    """
+    Drop-in replacement for the YOLO model object in Avian, forwarding frames to the shared inference server.
+    The tracks come back as a regular ultralytics Results object, so ObjectCounter works unchanged.
+    """
+
+    def __init__(self, feed_id, model_name, tracker="botsort.yaml", fps=30, backend="ultralytics",
+                 detector_args=None, host=INFERENCE_SERVER_HOST, port=INFERENCE_SERVER_PORT, connect_timeout=120):
+        self.feed_id = feed_id
+        self.authkey = inference_authkey()
+        if self.authkey is None:
+            raise ValueError("No inference server key, set AVIAN_INFERENCE_AUTHKEY or create "
+                             + INFERENCE_SERVER_KEY_FILE)
+        address = inference_server_address(host, port)
+        self.conn = self._connect(address, connect_timeout)
+        # A unix socket means the server runs on this host and can map the frame slot
+        self.use_slot = isinstance(address, str)
+        self.slot = None
+        self.slot_generation = 0
+        self.conn.send({"type": "register", "feed_id": feed_id, "model_name": model_name, "tracker": tracker,
+                        "fps": fps, "backend": backend, "detector_args": detector_args or {}})
+        reply = self.conn.recv()
+        if "error" in reply:
+            self.conn.close()
+            raise ValueError(f"Inference server rejected feed {feed_id}: {reply['error']}")
+        self.names = reply["names"]
+
+    def _connect(self, address, connect_timeout):
+        # The server may still be starting up (loading weights), retry with backoff
+        deadline = time.monotonic() + connect_timeout
+        delay = 0.5
+        while True:
+            try:
+                return Client(address, authkey=self.authkey)
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
+
+    def _write_slot(self, source):
+        source = np.ascontiguousarray(source)
+        if self.slot is None or self.slot.size < FRAME_SLOT_HEADER_SIZE + source.nbytes:
+            self._close_slot()
+            self.slot_generation += 1
+            name = f"avian_infer_{self.feed_id}_{os.getpid()}_{self.slot_generation}"
+
+            def writer_pid(buf):
+                magic, pid = FRAME_SLOT_HEADER.unpack_from(buf, 0)
+                return pid if magic == FRAME_SLOT_MAGIC else None
+            self.slot = create_segment(name, FRAME_SLOT_HEADER_SIZE + source.nbytes, writer_pid, "Frame slot")
+            FRAME_SLOT_HEADER.pack_into(self.slot.buf, 0, FRAME_SLOT_MAGIC, os.getpid())
+        np.ndarray(source.shape, dtype=source.dtype, buffer=self.slot.buf, offset=FRAME_SLOT_HEADER_SIZE)[...] = source
+        return {"slot": self.slot.name, "shape": source.shape, "dtype": source.dtype.str}
+
+    def _close_slot(self):
+        if self.slot is None:
+            return
+        self.slot.close()
+        try:
+            self.slot.unlink()
+        except FileNotFoundError:
+            pass
+        self.slot = None
+
+    def track(self, source, persist=True, show=False, verbose=False, classes=None, conf=0.25, imgsz=640, **kwargs):
+        message = {"type": "track", "conf": conf, "classes": classes, "imgsz": imgsz}
+        if self.use_slot:
+            message.update(self._write_slot(source))
+        else:
+            message["frame"] = source
+        self.conn.send(message)
+        reply = self.conn.recv()
+        if reply["error"] is not None:
+            print("Inference server error for feed", self.feed_id, ":", reply["error"])
+
+        tracks = reply["tracks"]
+        if tracks is None:
+            tracks = np.empty((0, 6), dtype=np.float32)
+        return [Results(orig_img=source, path="", names=self.names, boxes=torch.as_tensor(tracks))]
+
+    def close(self):
+        self.conn.close()
+        self._close_slot()
+
+
+class LocalInferenceClient:
+    """InferenceClient for feeds running in the same process as the ModelWorker (see ingest_host.py)."""
+
+    def __init__(self, worker, feed_id, tracker="botsort.yaml", fps=30):
+        self.worker = worker
+        self.feed_id = feed_id
+        self.names = worker.names
+        worker.register_feed(feed_id, tracker, fps)
+
+    def track(self, source, persist=True, show=False, verbose=False, classes=None, conf=0.25, imgsz=640, **kwargs):
+        request = InferenceRequest(self.feed_id, source, conf, classes, imgsz)
+        self.worker.submit(request)
+        request.done.wait()
+        if request.error is not None:
+            print("Inference error for feed", self.feed_id, ":", request.error)
+
+        tracks = request.tracks
+        if tracks is None:
+            tracks = np.empty((0, 6), dtype=np.float32)
+        return [Results(orig_img=source, path="", names=self.names, boxes=torch.as_tensor(tracks))]
+
+    def close(self):
+        self.worker.unregister_feed(self.feed_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared batched inference server for all feeds")
+    parser.add_argument("--host", type=str, default=INFERENCE_SERVER_HOST,
+                        help="Listen on TCP at this host instead of the unix socket")
+    parser.add_argument("--port", type=int, default=INFERENCE_SERVER_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-latency-ms", type=float, default=MAX_LATENCY_MS)
+    parser.add_argument("--max-pending-per-feed", type=int, default=MAX_PENDING_PER_FEED)
+    parser.add_argument("--create-key", action="store_true",
+                        help="Create a random key file first if no key is configured")
+    args = parser.parse_args()
+
+    authkey = inference_authkey()
+    if authkey is None and args.create_key:
+        try:
+            create_authkey()
+        except FileExistsError:
+            # Created by a server started at the same time
+            pass
+        authkey = inference_authkey()
+    if authkey is None:
+        print("No inference server key configured, set AVIAN_INFERENCE_AUTHKEY or create", INFERENCE_SERVER_KEY_FILE,
+              "(inference_server.py --create-key). Not starting.")
+        sys.exit(1)
+
+    server = InferenceServer(authkey, args.host, args.port, args.max_batch_size, args.max_latency_ms,
+                             args.max_pending_per_feed)
+    try:
+        server.serve_forever()
+    except OSError as e:
+        # Most likely another server already owns the address
+        print("Inference server not started:", e)
+        sys.exit(0)
@@ -0,0 +1,290 @@
+# AVIAN: Multi-feed ingest host
+# Runs many feeds in one process: one Python interpreter, one torch init and one loaded model per detector for all
+# of them. Sources are decoded on a fixed pool of threads (streams wait for the network on a grab thread each),
+# every feed then infers (batched across feeds by a shared ModelWorker) and counts on its own thread, in frame order.
+# avian.py keeps working as the one-process-per-feed entry point, a feed must only be run by one of the two.
+import argparse
+import heapq
+import itertools
+import os
+import resource
+import signal
+import sys
+import threading
+import time
+
+from avian import Avian
+from capture import READY, SKIPPED, CaptureThread
+from db.db_queries import DBQueries
+from detectors import worker_key
+from event_writer import EventWriter
+from inference_server import LocalInferenceClient, ModelWorker
+from pipeline import Stage
+
+
+def process_rss():
+    # Current resident set size in bytes, peak RSS where /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+class DecodePool:
+    """
+    Fixed number of threads decoding all the sources of the host. Files are picked in due order, at their playback
+    time when paced. Every stream has a grab thread of its own that waits on the network and sits out the reconnect
+    backoff, the pool only decodes the frames it grabbed. A stalled camera therefore never holds a decode thread.
+    A source is only ever read by one thread at a time.
+    """
+
+    def __init__(self, workers=8):
+        self.workers = workers
+        self.heap = []
+        self.order = itertools.count()
+        self.cond = threading.Condition()
+        self.running = True
+        self.threads = [threading.Thread(target=self.run, name="Decode-" + str(i), daemon=True)
+                        for i in range(workers)]
+
+    def add(self, reader, sink, on_end):
+        if reader.is_stream:
+            threading.Thread(target=self.grab, args=((reader, sink, on_end),), name="Grab-" + reader.name,
+                             daemon=True).start()
+        else:
+            self._schedule(time.monotonic(), ((reader, sink, on_end), None))
+
+    def _schedule(self, due, entry):
+        with self.cond:
+            heapq.heappush(self.heap, (due, next(self.order), entry))
+            self.cond.notify()
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def grab(self, entry):
+        reader, sink, on_end = entry
+        retrieved = threading.Event()
+        while self.running and reader.running:
+            result = reader.grab_next()
+            if result is None:
+                reader.finished = True
+                on_end()
+                return
+            if result is not READY:
+                continue
+            # The next grab would replace this frame, wait until a decode thread has retrieved it
+            retrieved.clear()
+            self._schedule(time.monotonic(), (entry, retrieved))
+            while self.running and not retrieved.wait(1.0):
+                pass
+
+    def run(self):
+        while self.running:
+            with self.cond:
+                if not self.heap:
+                    self.cond.wait(1.0)
+                    continue
+                due = self.heap[0][0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                _, _, (entry, retrieved) = heapq.heappop(self.heap)
+
+            reader, sink, on_end = entry
+            if retrieved is not None:
+                # Grabbed by the grab thread of a stream
+                frame = reader.retrieve_frame()
+                retrieved.set()
+                if frame is not SKIPPED:
+                    sink(frame)
+                continue
+
+            frame = reader.read_next()
+            if frame is None:
+                reader.finished = True
+                on_end()
+                continue
+            if frame is not SKIPPED:
+                sink(frame)
+            self._schedule(time.monotonic() + (reader.pacing_delay() if frame is not SKIPPED else 0),
+                           (entry, None))
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+
+
+class IngestFeed:
+    """One feed of the host: its Avian (sections, counters, stats, preview), capture reader and processing stage."""
+
+    def __init__(self, avian):
+        self.avian = avian
+        self.reader = CaptureThread(avian.video_path, avian.cap, pacing=avian.capture_pacing,
+                                    open_fn=avian.open_capture, target_fps=avian.capture_target_fps,
+                                    name="Capture-" + str(avian.feed_id))
+        # Live sources drop their oldest queued frame when the feed falls behind, files wait
+        self.stage = Stage("feed_" + str(avian.feed_id), self.process, queue_size=avian.pipeline_queue_size,
+                           drop_oldest=self.reader.is_stream)
+        self.processed_frames = 0
+        self.fps_window_start = time.time()
+
+    def start(self):
+        self.avian.ee_counter_array = self.avian.create_counters()
+        self.stage.start()
+
+    def process(self, frame):
+        avian = self.avian
+        if avian.reload_sections:
+            avian.ee_counter_array = avian.refresh_sections(avian.ee_counter_array)
+        self.reader.frame_stride = avian.load_controller.frame_stride()
+
+        avian.load_controller.start_frame()
+        # Motion gated frames come back without tracks, they are only drawn for a viewer
+        tracks = avian.infer(frame)
+        im0 = avian.count_frame((frame, tracks))
+        if im0 is not None:
+            avian.publish_preview(im0)
+        avian.load_controller.end_frame()
+
+        self.processed_frames += 1
+        if time.time() - self.fps_window_start >= 1:
+            avian.stats.set("fps", round(self.processed_frames / (time.time() - self.fps_window_start), 2))
+            for key, value in self.reader.counters().items():
+                avian.stats.set(key, value)
+            for key, value in self.stage.metrics().items():
+                avian.stats.set(key, value)
+            for key, value in avian.track_stats().items():
+                avian.stats.set(key, value)
+            avian.stats.set("zones", avian.zone_stats())
+            for key, value in avian.event_writer.metrics().items():
+                avian.stats.set(key, value)
+            self.processed_frames = 0
+            self.fps_window_start = time.time()
+        avian.load_controller.report(avian.stats)
+        avian.stats.publish()
+
+    def frame_buffer_bytes(self):
+        queued = sum(item.image.nbytes for item in list(self.stage.input.items) if hasattr(item, "image"))
+        return queued + self.avian.frame_bus.size
+
+    def stop(self):
+        self.reader.running = False
+        stopped = self.stage.stop()
+        self.avian.cap.release()
+        if stopped:
+            self.avian.close_outputs()
+        else:
+            print("Feed", self.avian.feed_id, "did not stop in time, leaving its frame bus and live state open")
+        self.avian.stats.remove()
+
+
+class IngestHost:
+    def __init__(self, feed_ids, query, decode_workers=8):
+        self.query = query
+        self.workers = {}
+        self.feeds = []
+        self.pool = DecodePool(decode_workers)
+        self.finished = threading.Event()
+        # One writer batches the events of all the feeds
+        self.event_writer = EventWriter(query.db.get_engine())
+        self.event_writer.start()
+
+        for feed_id in feed_ids:
+            feed = self.create_feed(feed_id)
+            if feed is not None:
+                self.feeds.append(feed)
+        self.remaining = len(self.feeds)
+        self.lock = threading.Lock()
+
+        # Every Avian installed its own handlers, the host handles the signals for all of them
+        signal.signal(signal.SIGTERM, self.sigterm_handler)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.sighup_handler)
+
+    def get_worker(self, config):
+        backend = str(config.get("detector_backend", "ultralytics"))
+        detector_args = {"imgsz": int(config.get("imgsz", 640)),
+                         "int8": str(config.get("detector_int8", "false")).lower() == "true"}
+        key = worker_key(backend, config["model_name"], detector_args)
+        if key not in self.workers:
+            print("Loading model", config["model_name"], "on backend", backend)
+            worker = ModelWorker(config["model_name"], backend, **detector_args)
+            worker.start()
+            self.workers[key] = worker
+        return self.workers[key]
+
+    def create_feed(self, feed_id):
+        section_obj = self.query.get_sections(feed_id)
+        feed_url = self.query.get_feed_url(feed_id)
+        config = self.query.get_feed_config(feed_id)
+        camera_id = self.query.get_feed_camera_id(feed_id)
+        if section_obj is None or feed_url is None or config is None:
+            print("Feed", feed_id, "is missing sections, url or config, not starting it")
+            return None
+
+        worker = self.get_worker(config)
+        tracker = str(config.get("tracker", "botsort.yaml"))
+        avian = Avian(section_obj, feed_url, config, feed_id, camera_id, self.query,
+                      model_factory=lambda fps: LocalInferenceClient(worker, feed_id, tracker, fps),
+                      event_writer=self.event_writer)
+        return IngestFeed(avian)
+
+    def feed_ended(self, feed):
+        print("Feed", feed.avian.feed_id, "has ended")
+        with self.lock:
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self.finished.set()
+
+    def sighup_handler(self, signum, frame):
+        for feed in self.feeds:
+            feed.avian.reload_sections = True
+
+    def sigterm_handler(self, signum, frame):
+        print("SIGTERM received, stopping the ingest host")
+        self.finished.set()
+
+    def report_memory(self):
+        rss = process_rss()
+        per_feed = rss // max(1, len(self.feeds))
+        for feed in self.feeds:
+            feed.avian.stats.set("host_rss_bytes", rss)
+            feed.avian.stats.set("rss_per_feed_bytes", per_feed)
+            feed.avian.stats.set("frame_buffer_bytes", feed.frame_buffer_bytes())
+        return rss, per_feed
+
+    def run(self, report_interval=30):
+        for feed in self.feeds:
+            feed.start()
+            self.pool.add(feed.reader, feed.stage.put, lambda feed=feed: self.feed_ended(feed))
+        self.pool.start()
+        print("Ingest host running", len(self.feeds), "feeds on", self.pool.workers, "decode threads")
+
+        while not self.finished.wait(report_interval):
+            rss, per_feed = self.report_memory()
+            print("Ingest host RSS", round(rss / 1e6, 1), "MB,", round(per_feed / 1e6, 1), "MB per feed")
+
+        self.pool.stop()
+        for feed in self.feeds:
+            feed.stop()
+        self.event_writer.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many feeds in one process with a shared decode pool")
+    parser.add_argument("feed_ids", type=str, nargs="+", help="Feed ids")
+    parser.add_argument("--decode-workers", type=int, default=8)
+    parser.add_argument("--report-interval", type=float, default=30)
+    args = parser.parse_args()
+
+    host = IngestHost(args.feed_ids, DBQueries(), args.decode_workers)
+    if not host.feeds:
+        print("No feed could be started")
+        sys.exit(0)
+    host.run(args.report_interval)
@@ -0,0 +1,104 @@
+import time
+
+# Load shedding levels, from full quality to the cheapest mode. Each step down trades something for latency:
+# first frames are skipped, then inference resolution is lowered, then preview encoding is turned off.
+LOAD_LEVELS = [
+    {"name": "full", "frame_stride": 1, "imgsz_scale": 1.0, "preview": True},
+    {"name": "skip_frames", "frame_stride": 2, "imgsz_scale": 1.0, "preview": True},
+    {"name": "lower_imgsz", "frame_stride": 2, "imgsz_scale": 0.75, "preview": True},
+    {"name": "no_preview", "frame_stride": 2, "imgsz_scale": 0.75, "preview": False},
+    {"name": "skip_more_frames", "frame_stride": 3, "imgsz_scale": 0.75, "preview": False},
+    {"name": "minimum", "frame_stride": 3, "imgsz_scale": 0.5, "preview": False},
+]
+
+
+class LoadController:
+    """
+    Per-feed latency/fps controller for Avian.run_tracker.
+
+    The measured per-frame cost (EWMA) is compared against the budget of the current level, which is the
+    smaller of the latency target and the time available per processed frame at the target fps
+    (frame_stride / target_fps). The level steps down after `patience` frames over budget and steps back up
+    once the cost would also fit the budget of the level above with some headroom.
+    """
+
+    def __init__(self, target_fps=None, max_latency_ms=None, imgsz=640, patience=10, recover_patience=50,
+                 headroom=0.7, smoothing=0.2):
+        self.target_fps = target_fps
+        self.max_latency = max_latency_ms / 1000.0 if max_latency_ms else None
+        self.base_imgsz = imgsz
+        self.patience = patience
+        self.recover_patience = recover_patience
+        self.headroom = headroom
+        self.smoothing = smoothing
+
+        self.level = 0
+        self.cost = None
+        self.over_budget = 0
+        self.under_budget = 0
+        self.frame_start = None
+
+    def budget(self, level=None):
+        level = self.level if level is None else level
+        budgets = []
+        if self.target_fps:
+            budgets.append(LOAD_LEVELS[level]["frame_stride"] / float(self.target_fps))
+        if self.max_latency:
+            budgets.append(self.max_latency)
+        return min(budgets) if budgets else None
+
+    def frame_stride(self):
+        # Applied by the capture thread, frames off the stride are grabbed but never decoded
+        return LOAD_LEVELS[self.level]["frame_stride"]
+
+    def imgsz(self):
+        # Ultralytics needs a multiple of the model stride (32)
+        return max(32, int(round(self.base_imgsz * LOAD_LEVELS[self.level]["imgsz_scale"] / 32)) * 32)
+
+    def preview_enabled(self):
+        return LOAD_LEVELS[self.level]["preview"]
+
+    def start_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        cost = time.perf_counter() - self.frame_start
+        self.frame_start = None
+        self.cost = cost if self.cost is None else self.smoothing * cost + (1 - self.smoothing) * self.cost
+        self._adjust()
+
+    def _adjust(self):
+        budget = self.budget()
+        if budget is None:
+            return
+
+        if self.cost > budget:
+            self.over_budget += 1
+            self.under_budget = 0
+            if self.over_budget >= self.patience and self.level < len(LOAD_LEVELS) - 1:
+                self._set_level(self.level + 1)
+        elif self.level > 0 and self.cost < self.headroom * self.budget(self.level - 1):
+            self.under_budget += 1
+            self.over_budget = 0
+            if self.under_budget >= self.recover_patience:
+                self._set_level(self.level - 1)
+        else:
+            self.over_budget = 0
+            self.under_budget = 0
+
+    def _set_level(self, level):
+        print("Load level changed from", LOAD_LEVELS[self.level]["name"], "to", LOAD_LEVELS[level]["name"],
+              "(frame cost", round(self.cost * 1000, 1), "ms)")
+        self.level = level
+        self.over_budget = 0
+        self.under_budget = 0
+
+    def report(self, stats):
+        stats.set("load_level", self.level)
+        stats.set("load_level_name", LOAD_LEVELS[self.level]["name"])
+        stats.set("frame_cost_ms", round(self.cost * 1000, 2) if self.cost is not None else None)
+        budget = self.budget()
+        stats.set("frame_budget_ms", round(budget * 1000, 2) if budget is not None else None)
+        stats.set("imgsz", self.imgsz())
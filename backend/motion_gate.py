@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap motion detector run before the model.
+
+    Frames are downscaled to a small grayscale image and compared against a running-average background,
+    restricted to the configured sections (dilated by a small margin so people approaching a line are caught).
+    When the changed area stays under `sensitivity` (fraction of the masked pixels) inference can be skipped.
+    Every `refresh_interval` frames inference is forced anyway so the tracker never goes stale for long.
+    """
+
+    def __init__(self, regions=None, sensitivity=0.005, pixel_threshold=25, refresh_interval=50, scale_width=160,
+                 learning_rate=0.05, margin=0.05):
+        self.regions = regions or []
+        self.sensitivity = sensitivity
+        self.pixel_threshold = pixel_threshold
+        self.refresh_interval = refresh_interval
+        self.scale_width = scale_width
+        self.learning_rate = learning_rate
+        self.margin = margin
+
+        self.background = None
+        self.mask = None
+        self.mask_pixels = 0
+        self.frame_shape = None
+        self.frames_since_inference = 0
+        self.motion_ratio = 0.0
+
+    def set_regions(self, regions):
+        self.regions = regions
+        self.frame_shape = None
+
+    def _build_mask(self, frame_shape, small_shape):
+        self.frame_shape = frame_shape
+        self.background = None
+        if not self.regions:
+            self.mask = None
+            self.mask_pixels = small_shape[0] * small_shape[1]
+            return
+
+        scale_x = small_shape[1] / frame_shape[1]
+        scale_y = small_shape[0] / frame_shape[0]
+        mask = np.zeros(small_shape, dtype=np.uint8)
+        for region in self.regions:
+            pts = np.array([(x * scale_x, y * scale_y) for x, y in region], dtype=np.int32)
+            cv2.fillPoly(mask, [pts], 255)
+
+        margin = max(1, int(self.margin * small_shape[1]))
+        mask = cv2.dilate(mask, np.ones((2 * margin + 1, 2 * margin + 1), dtype=np.uint8))
+        self.mask = mask > 0
+        self.mask_pixels = max(1, int(np.count_nonzero(self.mask)))
+
+    def has_motion(self, frame):
+        height, width = frame.shape[:2]
+        small_height = max(1, int(height * self.scale_width / width))
+        if self.frame_shape != frame.shape[:2]:
+            self._build_mask(frame.shape[:2], (small_height, self.scale_width))
+
+        small = cv2.resize(frame, (self.scale_width, small_height), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            self.frames_since_inference = 0
+            return True
+
+        moving = cv2.absdiff(gray, cv2.convertScaleAbs(self.background)) > self.pixel_threshold
+        if self.mask is not None:
+            moving &= self.mask
+        self.motion_ratio = np.count_nonzero(moving) / self.mask_pixels
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+
+        self.frames_since_inference += 1
+        if self.motion_ratio >= self.sensitivity or self.frames_since_inference >= self.refresh_interval:
+            self.frames_since_inference = 0
+            return True
+        return False
@@ -0,0 +1,140 @@
+# AVIAN: Offline re-analysis of recorded videos
+# Decodes ahead on the capture thread, detects on batches of consecutive frames and feeds the tracker and the
+# counters in frame order. Events are stamped with the video time of their frame instead of the wall clock.
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from avian import Avian
+from capture import CaptureThread, is_stream_source
+from db.db_queries import DBQueries
+from tracking import FeedTracker
+
+
+def recording_start_time(video_path, duration):
+    # Recorders close the file when the recording ends, so its mtime minus the duration is when it started
+    return datetime.fromtimestamp(os.path.getmtime(video_path)) - timedelta(seconds=duration)
+
+
+class OfflineAvian(Avian):
+    """Avian for recorded files: same sections, counters and detector config, run for throughput instead of latency."""
+
+    def __init__(self, section_obj, video_path, config, feed_id, camera_id, query, batch_size=16, start_time=None):
+        config = dict(config)
+        # Batching needs the detector in this process, and the fps cap would only throw frames away
+        config["inference_mode"] = "local"
+        config["capture_fps"] = 0
+        config["detect_interval"] = 1
+        # No preview or live counts, the live worker of the feed may be running. Stats go to offline_<feed_id>.
+        super(OfflineAvian, self).__init__(section_obj, video_path, config, feed_id, camera_id, query, live=False)
+        self.batch_size = batch_size
+        self.tracker = FeedTracker(str(config.get("tracker", "botsort.yaml")), frame_rate=self.fps or 30)
+        duration = self.frame_count / self.fps if self.fps else 0
+        self.start_time = start_time or recording_start_time(video_path, duration)
+
+    def frame_time(self, frame):
+        return self.start_time + timedelta(milliseconds=frame.source_msec)
+
+    def process_batch(self, frames):
+        images = [frame.image for frame in frames]
+        model_inputs = images
+        if self.roi_cropper is not None:
+            model_inputs = [np.ascontiguousarray(self.roi_cropper.crop(image)) for image in images]
+        detections = self.model.detect(model_inputs, imgsz=self.load_controller.base_imgsz,
+                                       conf=self.track_confidence, classes=self.classes_to_count)
+
+        # Tracking and counting stay sequential, in frame order
+        for frame, model_input, dets in zip(frames, model_inputs, detections):
+            tracks = self.tracker.update_detections(dets, model_input)
+            tracks = [Results(orig_img=model_input, path="", names=self.model.names, boxes=torch.as_tensor(tracks))]
+            if self.roi_cropper is not None:
+                tracks = self.roi_cropper.to_frame(tracks, frame.image)
+            for ee_counter in self.ee_counter_array:
+                ee_counter.start_counting(frame.image, tracks, frame.seq, self.frame_time(frame), render=False,
+                                          source_frame=frame.index)
+
+    def run_offline(self):
+        self.ee_counter_array = self.create_counters()
+        self.cam_thread = CaptureThread(self.video_path, self.cap, ring_size=self.batch_size * 2, pacing="max_speed",
+                                        open_fn=self.open_capture)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        self.cam_thread.start()
+
+        processed = 0
+        last_seq = -1
+        batch = []
+        self.running = True
+        while True:
+            # On SIGTERM the frames already read are still counted, then the run ends as if the video did
+            frame = None if self.stopping else self.cam_thread.next_frame(last_seq, timeout=1.0)
+            if frame is not None:
+                last_seq = frame.seq
+                batch.append(frame)
+            elif not self.cam_thread.finished and not self.stopping:
+                continue
+            if batch and (len(batch) >= self.batch_size or frame is None):
+                self.process_batch(batch)
+                processed += len(batch)
+                position = self.frame_time(batch[-1])
+                batch = []
+
+                wall = time.perf_counter() - wall_start
+                cpu = time.process_time() - cpu_start
+                self.stats.set("offline_frames", processed)
+                self.stats.set("fps", round(processed / wall, 2) if wall else 0)
+                self.stats.set("fps_per_core", round(processed / cpu, 2) if cpu else 0)
+                self.stats.set("video_position", str(position))
+                self.stats.publish()
+            if frame is None:
+                break
+
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        print("Processed", processed, "frames in", round(wall, 1), "s:", round(processed / wall, 1) if wall else 0,
+              "fps,", round(processed / cpu, 1) if cpu else 0, "fps per core")
+        for ee_counter in self.ee_counter_array:
+            for name, entries, exits in ee_counter.counts():
+                print(name, "entries:", entries, "exits:", exits)
+        for zone_id, zone in self.zone_stats().items():
+            print("Zone", zone_id, "visits:", zone["visits"], "average dwell:", zone["avg_dwell_s"], "s")
+        self.stats.set("zones", self.zone_stats())
+        self.stats.publish(force=True)
+
+        self.cam_thread.stop()
+        self.cap.release()
+        self.close_outputs()
+        self.stop_event_writer()
+        self.running = False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count the objects in a recorded video of a feed as fast as possible")
+    parser.add_argument("feed_id", type=str, help="Feed id, its sections and config are used")
+    parser.add_argument("--video", type=str, default=None, help="Recorded video, the feed url by default")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--start-time", type=str, default=None,
+                        help="ISO time of the first frame, defaults to the file mtime minus its duration")
+    args = parser.parse_args()
+
+    query = DBQueries()
+    section_obj = query.get_sections(args.feed_id)
+    config = query.get_feed_config(args.feed_id)
+    camera_id = query.get_feed_camera_id(args.feed_id)
+    video_path = args.video or query.get_feed_url(args.feed_id)
+
+    if section_obj is None or config is None or video_path is None:
+        print("Feed", args.feed_id, "is missing sections, config or url")
+        exit(0)
+    if is_stream_source(video_path):
+        print("Offline mode needs a recorded video file, got", video_path)
+        exit(0)
+
+    start_time = datetime.fromisoformat(args.start_time) if args.start_time else None
+    avian = OfflineAvian(section_obj, video_path, config, args.feed_id, camera_id, query, args.batch_size, start_time)
+    avian.run_offline()
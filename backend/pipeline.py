@@ -0,0 +1,102 @@
+import threading
+import time
+import traceback
+from collections import deque
+
+STOP = object()
+
+
+class StageQueue:
+    """
+    Bounded FIFO between two pipeline stages. With drop_oldest a full queue discards its oldest item (counted in
+    dropped), otherwise put() blocks until the consumer catches up so no item is ever lost.
+    """
+
+    def __init__(self, size=4, drop_oldest=True):
+        self.items = deque()
+        self.size = size
+        self.drop_oldest = drop_oldest
+        self.cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if item is not STOP:
+                if self.drop_oldest:
+                    if len(self.items) >= self.size:
+                        self.items.popleft()
+                        self.dropped += 1
+                else:
+                    while len(self.items) >= self.size:
+                        self.cond.wait()
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.items:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Stage(threading.Thread):
+    """
+    One pipeline stage: a thread applying fn to every item of its input queue, in order, and passing non None
+    results on to the output queue. Keeps the queue depth and a smoothed per-item latency for the feed stats.
+    """
+
+    def __init__(self, name, fn, queue_size=4, drop_oldest=True, output=None, smoothing=0.1):
+        super(Stage, self).__init__(name=name, daemon=True)
+        self.fn = fn
+        self.input = StageQueue(queue_size, drop_oldest)
+        self.output = output
+        self.smoothing = smoothing
+        self.latency_ms = 0.0
+        self.processed = 0
+        self.failures = 0
+
+    def put(self, item):
+        self.input.put(item)
+
+    def run(self):
+        while True:
+            item = self.input.get(timeout=1.0)
+            if item is None:
+                continue
+            if item is STOP:
+                break
+
+            start = time.perf_counter()
+            try:
+                result = self.fn(item)
+            except Exception:
+                # The item is lost (for the counting stage: the counts of a frame), never silently
+                self.failures += 1
+                print("Pipeline stage", self.name, "failed on an item:")
+                traceback.print_exc()
+                continue
+            latency = (time.perf_counter() - start) * 1000
+            self.latency_ms += self.smoothing * (latency - self.latency_ms) if self.processed else latency
+            self.processed += 1
+
+            if result is not None and self.output is not None:
+                self.output.put(result)
+
+    def stop(self, timeout=5):
+        # Returns False when the thread is still busy after timeout, whatever it writes to must then stay open
+        self.input.put(STOP)
+        self.join(timeout)
+        return not self.is_alive()
+
+    def metrics(self):
+        prefix = self.name + "_"
+        return {prefix + "queue_depth": len(self.input), prefix + "latency_ms": round(self.latency_ms, 2),
+                prefix + "processed": self.processed, prefix + "dropped": self.input.dropped,
+                prefix + "failures": self.failures}
@@ -0,0 +1,56 @@
+from ultralytics.engine.results import Results
+
+
+class RoiCropper:
+    """
+    Restricts inference to the bounding box of the union of a feed's sections (plus a margin).
+
+    The detector only sees the crop, detections are mapped back to frame coordinates before counting so the
+    counters and the tracker output keep working in full frame coordinates.
+    """
+
+    def __init__(self, regions, margin=32):
+        self.margin = margin
+        self.regions = regions
+        self.frame_shape = None
+        self.box = None
+
+    def update(self, regions):
+        self.regions = regions
+        self.frame_shape = None
+
+    def _compute_box(self, frame_shape):
+        self.frame_shape = frame_shape
+        height, width = frame_shape
+        points = [point for region in self.regions for point in region]
+        if not points:
+            self.box = None
+            return
+
+        x1 = max(0, int(min(x for x, y in points)) - self.margin)
+        y1 = max(0, int(min(y for x, y in points)) - self.margin)
+        x2 = min(width, int(max(x for x, y in points)) + self.margin)
+        y2 = min(height, int(max(y for x, y in points)) + self.margin)
+        if x2 <= x1 or y2 <= y1 or (x1, y1, x2, y2) == (0, 0, width, height):
+            self.box = None
+        else:
+            self.box = (x1, y1, x2, y2)
+        print("Inference region:", self.box if self.box is not None else "full frame")
+
+    def crop(self, frame):
+        if self.frame_shape != frame.shape[:2]:
+            self._compute_box(frame.shape[:2])
+        if self.box is None:
+            return frame
+        x1, y1, x2, y2 = self.box
+        return frame[y1:y2, x1:x2]
+
+    def to_frame(self, tracks, frame):
+        if self.box is None:
+            return tracks
+        x1, y1, _, _ = self.box
+        result = tracks[0]
+        data = result.boxes.data.clone()
+        data[:, [0, 2]] += x1
+        data[:, [1, 3]] += y1
+        return [Results(orig_img=frame, path=result.path, names=result.names, boxes=data)]
@@ -7,7 +7,11 @@ import pandas as pd
 import numpy as np
 from db.db_service import DBService
 from utils.vector_utils import VectorUtils
+from crossing import CrossingEngine, PolylineCrossingEngine
+from track_table import TrackHistory, TrackTable
+from zones import ZoneMask
 from datetime import datetime
+import time
 
 ENTRY_THRESHOLD = 1
 EXIT_THRESHOLD = 5
@@ -16,18 +20,36 @@ check_requirements("shapely>=2.0.0")
 
 from shapely.geometry import LineString, Point, Polygon
 
+def interpolate_track(info, frame_count, position, track_length):
+    # Frames skipped for this track (detect interval, load shedding, motion gate) are filled in linearly, so the
+    # history stays one point per frame and the backtrack chord always spans backtrack_length frames
+    last_frame, info.last_frame = info.last_frame, frame_count
+    if last_frame is None or not info.track_history:
+        return
+    gap = frame_count - last_frame
+    if gap <= 1:
+        return
+    x0, y0 = info.track_history[-1]
+    for step in range(max(1, gap - track_length), gap):
+        t = step / gap
+        info.track_history.append((x0 + (position[0] - x0) * t, y0 + (position[1] - y0) * t))
+
 class ObjectInfo:
-    def __init__(self):
+    __slots__ = ("entry_frame", "frame_count", "exit_frame", "track_history", "dwell_time", "entered", "exited",
+                 "embedding", "entry_started", "exit_started", "last_frame")
+
+    def __init__(self, track_length=30):
         self.entry_frame = None
         self.frame_count = 0
         self.exit_frame = None
-        self.track_history = []
+        self.track_history = TrackHistory(track_length)
         self.dwell_time = None
         self.entered = False
         self.exited = False
         self.embedding = []
         self.entry_started = False
         self.exit_started = False
+        self.last_frame = None
 
 class ObjectCounter:
     """A class to manage the counting of objects in a real-time video stream based on their tracks."""
@@ -53,6 +75,7 @@ class ObjectCounter:
 
         self.names = None
         self.annotator = None
+        self.render = True
 
         self.counting_list = []
         self.count_txt_thickness = 0
@@ -60,7 +83,7 @@ class ObjectCounter:
         self.count_color = (255, 255, 255)
 
         self.track_history = defaultdict(list)
-        self.object_info = defaultdict(ObjectInfo)
+        self.object_info = TrackTable(lambda: ObjectInfo(self.track_length))
         self.track_thickness = 2
         self.draw_tracks = False
         self.track_color = (0, 255, 0)
@@ -72,9 +95,12 @@ class ObjectCounter:
         self.env_check = check_imshow(warn=True)
 
         self.frame_count = 0
+        self.source_frame = 0
+        self.frame_time = None
         self.last_saved_frame = 0
         self.entry_count = 0
         self.exit_count = 0
+        self.last_event_time = None
 
         self.backtrack_length = 10
 
@@ -104,7 +130,8 @@ class ObjectCounter:
         region_id = 0,
         camera_id = 1,
         feed_id = 1,
-        query_obj = None
+        query_obj = None,
+        track_ttl = 300
     ):
         """
         Configures the Counter's image, bounding box line thickness, and counting region points.
@@ -123,6 +150,8 @@ class ObjectCounter:
         self.camera_id = camera_id
         self.feed_id = feed_id
         self.query_obj = query_obj
+        # Tracks unseen for track_ttl frames are forgotten
+        self.object_info.ttl_frames = track_ttl
 
         print("--------------------------------------------------------------------")
         print(self.counter_name + " Analysis Initiated.")
@@ -171,9 +200,10 @@ class ObjectCounter:
         self.region_color = count_reg_color
         self.region_thickness = region_thickness
         self.line_dist_thresh = line_dist_thresh
+        # Entry line is reg_pts[2] -> reg_pts[3], exit line reg_pts[1] -> reg_pts[0]
+        self.crossing = CrossingEngine([[self.reg_pts[2], self.reg_pts[3]], [self.reg_pts[1], self.reg_pts[0]]])
 
-    def extract_and_process_tracks(self, tracks):
-
+    def draw_overlay(self):
         cv2.putText(self.im0, f"Entry {self.region_id} Count: {self.entry_count}", (50, 50 + self.region_id * 100), cv2.FONT_HERSHEY_SIMPLEX, 1, (36, 255, 12), 2)
         cv2.putText(self.im0, f"Exit {self.region_id} Count: {self.exit_count}", (50, 100 + self.region_id * 100), cv2.FONT_HERSHEY_SIMPLEX, 1, (36, 255, 12), 2)
 
@@ -183,6 +213,17 @@ class ObjectCounter:
         self.annotator = Annotator(self.im0, self.tf, self.names)
         self.annotator.draw_region(reg_pts=self.reg_pts, color=self.region_color, thickness=self.region_thickness)
 
+    def render_overlay(self, im0):
+        # A frame that was not counted (motion gated) still shows the region and the last counts
+        self.im0 = im0
+        self.draw_overlay()
+        return self.im0
+
+    def extract_and_process_tracks(self, tracks):
+
+        if self.render:
+            self.draw_overlay()
+
         if tracks[0].boxes.id is None:
             return
 
@@ -190,58 +231,62 @@ class ObjectCounter:
         clss = tracks[0].boxes.cls.cpu().tolist()
         track_ids = tracks[0].boxes.id.int().cpu().tolist()
 
+        chords = []
         for box, track_id, cls in zip(boxes, track_ids, clss):
-            self.annotator.box_label(box, label=f"Person {track_id}", color=colors(int(cls), True))
+            if self.render:
+                self.annotator.box_label(box, label=f"Person {track_id}", color=colors(int(cls), True))
 
-            track_line = self.object_info[track_id].track_history
+            info = self.object_info.get(track_id, self.frame_count)
+            track_line = info.track_history
             foot_position = (float((box[0] + box[2]) / 2), float(box[3]))
+            self.interpolate_track(info, foot_position)
             track_line.append(foot_position)
-            if len(track_line) > self.track_length:
-                track_line.pop(0)
 
-            if self.draw_tracks:
+            if self.render and self.draw_tracks:
                 #Change the color of the track line based on the position of the track. earliest points are violet and the latest points are red
                 self.track_color = (int(255 * (len(track_line) / self.track_length)), 0, int(255 * (1 - len(track_line) / self.track_length)))
                 self.annotator.draw_centroid_and_tracks(
-                    track_line, color=self.track_color, track_thickness=self.track_thickness
+                    track_line.array(), color=self.track_color, track_thickness=self.track_thickness
                 )                
 
             if len(track_line) >= self.backtrack_length:
-                start_point = track_line[len(track_line) - self.backtrack_length - 1]
-                end_point = track_line[len(track_line) - 1]
-
-                # Check for all points between start_point and end_point
-                for i in range(len(track_line) - self.backtrack_length, len(track_line)):
-                    #if self.counting_region.contains(Point(track_line[i])):
-                    entry_line = [self.reg_pts[2], self.reg_pts[3]]
-                    exit_line = [self.reg_pts[1], self.reg_pts[0]]
-                    track_vector = [start_point, end_point]
-
-                    if VectorUtils.check_intersection(track_vector, entry_line):
-                        cp = VectorUtils.cross_product(track_vector, entry_line)
-                        if not self.object_info[track_id].entered :
-                            
-                            if cp > 0 and self.object_info[track_id].entry_started:
-                                self.entry_count += 1
-                                self.object_info[track_id].entered = True
-                                curr_time = datetime.now()
-                                global_id = self.query_obj.new_global_id(self.camera_id, self.feed_id, self.region_id, self.frame_count, curr_time, curr_time)
-                                self.query_obj.record_entry_exit(self.feed_id, self.region_id, global_id, curr_time, "entry", curr_time, self.frame_count)
-                        if cp < 0:
-                            self.object_info[track_id].exit_started = True
-                                
-                    if VectorUtils.check_intersection(track_vector, exit_line):
-                        cp = VectorUtils.cross_product(track_vector, exit_line)
-                        if not self.object_info[track_id].exited:
-                            
-                            if cp < 0 and self.object_info[track_id].exit_started:
-                                self.exit_count += 1
-                                self.object_info[track_id].exited = True
-                                curr_time = datetime.now()
-                                global_id = self.query_obj.new_global_id(self.camera_id, self.feed_id, self.region_id, self.frame_count, curr_time, curr_time)
-                                self.query_obj.record_entry_exit(self.feed_id, self.region_id, global_id, curr_time, "exit", curr_time, self.frame_count)
-                        if cp > 0:
-                            self.object_info[track_id].entry_started = True
+                chords.append((track_id, track_line[len(track_line) - self.backtrack_length - 1], track_line[len(track_line) - 1]))
+
+        self.object_info.evict(self.frame_count)
+        if not chords:
+            return
+
+        # One vectorised crossing test for all the tracks of the frame, events are then recorded in track order
+        infos = [self.object_info[track_id] for track_id, _, _ in chords]
+        entries, exits, entry_first, entry_started, exit_started = self.crossing.step(
+            [start for _, start, _ in chords], [end for _, _, end in chords],
+            np.array([info.entered for info in infos], dtype=bool), np.array([info.exited for info in infos], dtype=bool),
+            np.array([info.entry_started for info in infos], dtype=bool),
+            np.array([info.exit_started for info in infos], dtype=bool))
+
+        for i, info in enumerate(infos):
+            info.entry_started = bool(entry_started[i])
+            info.exit_started = bool(exit_started[i])
+            if entries[i] and entry_first[i]:
+                self.record_event(info, "entry")
+            if exits[i]:
+                self.record_event(info, "exit")
+            if entries[i] and not entry_first[i]:
+                self.record_event(info, "entry")
+
+    def record_event(self, info, attribute):
+        if attribute == "entry":
+            self.entry_count += 1
+            info.entered = True
+        else:
+            self.exit_count += 1
+            info.exited = True
+        curr_time = self.frame_time or datetime.now()
+        self.last_event_time = curr_time
+        self.query_obj.record_event(self.camera_id, self.feed_id, self.region_id, curr_time, attribute, self.source_frame)
+
+    def interpolate_track(self, info, position):
+        interpolate_track(info, self.frame_count, position, self.track_length)
 
     def display_frames(self):
         #if self.env_check:
@@ -250,10 +295,26 @@ class ObjectCounter:
         if cv2.waitKey(1) & 0xFF == ord("q"):
             return
 
-    def start_counting(self, im0, tracks, fc):
+    def counts(self):
+        return [(self.counter_name, self.entry_count, self.exit_count)]
+
+    def live_sections(self):
+        return [(self.region_id, self.entry_count, self.exit_count, 0,
+                 self.last_event_time.timestamp() if self.last_event_time else 0.0)]
+
+    def track_stats(self):
+        return self.object_info.stats()
+
+    def start_counting(self, im0, tracks, fc, frame_time=None, render=True, source_frame=None, timestamp=None):
         self.im0 = im0
+        # Headless unless render: the frame is only drawn on when it is going to be shown
+        self.render = render
         #FIXME: Change the way the frame count is handled for streams and videos
         self.frame_count = fc
+        # fc counts the processed frames, events record the index of the frame in the source
+        self.source_frame = fc if source_frame is None else source_frame
+        # Offline runs pass the video timestamp of the frame, live feeds record events at wall clock time
+        self.frame_time = frame_time
 
         self.extract_and_process_tracks(tracks)
 
@@ -264,5 +325,351 @@ class ObjectCounter:
         return self.im0
 
 
+class FeedTrack:
+    """
+    Shared per-track state of a FeedCounter, flags holds [entered, exited, entry_started, exit_started] per section
+    and zone_entry the time (in seconds) the track entered each zone, NaN while it is outside.
+    """
+    __slots__ = ("track_history", "last_frame", "last_seen", "flags", "zone_entry")
+
+    def __init__(self, initial_flags, num_zones, track_length=30):
+        self.track_history = TrackHistory(track_length)
+        self.last_frame = None
+        self.last_seen = None
+        self.flags = initial_flags.copy()
+        self.zone_entry = np.full(num_zones, np.nan)
+
+class SectionCount:
+    """
+    Counts of one section and its geometry compiled to an entry and an exit polyline:
+      - entry_exit quad: entry line reg_pts[2] -> reg_pts[3], exit line reg_pts[1] -> reg_pts[0]
+      - {"entry": [...], "exit": [...]}: explicit entry and exit polylines
+      - tripwire: a single polyline, crossing it positively is an entry and negatively an exit
+      - zone: a polygon without lines, only counted for occupancy and dwell
+    Every section with an area (quads and zones) is also a zone of the FeedCounter ZoneMask.
+    """
+
+    def __init__(self, region_id, reg_pts, coordinates, section_type="entry_exit"):
+        self.region_id = region_id
+        self.section_coordinates = coordinates
+        self.section_type = section_type
+        self.counter_name = "Counter " + str(region_id)
+        self.entry_count = 0
+        self.exit_count = 0
+        self.occupancy = 0
+        self.last_event_time = None
+        self.visits = 0
+        self.dwell_total = 0.0
+
+        if isinstance(reg_pts, dict):
+            self.reg_pts = None
+            self.entry_line = [tuple(point) for point in reg_pts["entry"]]
+            self.exit_line = [tuple(point) for point in reg_pts["exit"]]
+        elif section_type == "tripwire":
+            self.reg_pts = None
+            self.entry_line = self.exit_line = [tuple(point) for point in reg_pts]
+        elif section_type == "zone":
+            self.reg_pts = [tuple(point) for point in reg_pts]
+            self.entry_line = []
+            self.exit_line = []
+        else:
+            self.reg_pts = [tuple(point) for point in reg_pts]
+            self.entry_line = [self.reg_pts[2], self.reg_pts[3]]
+            self.exit_line = [self.reg_pts[1], self.reg_pts[0]]
+
+    @property
+    def tripwire(self):
+        return self.entry_line is self.exit_line
+
+    def add_visit(self, seconds):
+        self.visits += 1
+        self.dwell_total += float(seconds)
+
+    def zone_stats(self):
+        return {"occupancy": self.occupancy, "visits": self.visits,
+                "avg_dwell_s": round(self.dwell_total / self.visits, 2) if self.visits else 0}
+
+    def live_state(self):
+        return (self.region_id, self.entry_count, self.exit_count, self.occupancy,
+                self.last_event_time.timestamp() if self.last_event_time else 0.0)
+
+    def initial_flags(self):
+        # A tripwire has no second line to arm it, entries and exits are armed from the start
+        return [False, False, self.tripwire, self.tripwire]
+
+class FeedCounter:
+    """
+    Counts every entry_exit and tripwire section of a feed in one pass per frame.
+
+    Boxes are moved to host memory once, track histories live in a single table shared by all sections, and the
+    crossing test of all tracks against all section lines is one PolylineCrossingEngine call. Events and counts are
+    still per section, recorded in the same order as one ObjectCounter per section would.
+    """
+
+    def __init__(self, feed_id, camera_id, query_obj, classes_names, width=1280, height=720, track_length=30,
+                 view_img=False, draw_tracks=False, line_thickness=2, track_thickness=2, region_color=(255, 0, 255),
+                 region_thickness=5, track_ttl=300, section_index=True, zone_mask_scale=0.5):
+        self.feed_id = feed_id
+        self.camera_id = camera_id
+        self.query_obj = query_obj
+        self.names = classes_names
+        self.width = width
+        self.height = height
+        self.track_length = track_length
+        self.view_img = view_img
+        self.draw_tracks = draw_tracks
+        self.tf = line_thickness
+        self.track_thickness = track_thickness
+        self.region_color = region_color
+        self.region_thickness = region_thickness
+        self.backtrack_length = 10
+        # STRtree over the section lines, False tests every track against every line
+        self.section_index = section_index
+
+        self.zone_mask_scale = zone_mask_scale
+
+        self.sections = []
+        self.initial_flags = np.zeros((0, 4), dtype=bool)
+        # Sections with an area, rasterised into self.zones
+        self.zone_sections = []
+        self.zones = None
+        # Tracks unseen for track_ttl frames are forgotten, their open zone visits end at their last frame
+        self.tracks = TrackTable(lambda: FeedTrack(self.initial_flags, len(self.zone_sections), self.track_length),
+                                 ttl_frames=track_ttl, on_evict=self.track_evicted)
+        self.crossing = None
+        self.frame_count = 0
+        self.source_frame = 0
+        self.frame_time = None
+        # Time of the current frame in seconds, zone dwell is measured on it
+        self.clock = 0.0
+        self.im0 = None
+        # Tracks of the last counted frame, and the pre-rendered section outlines (shape, pixels, values)
+        self.frame_data = None
+        self.overlay = None
+
+    def set_sections(self, sections):
+        """
+        Sets the (region_id, reg_pts, coordinates[, section_type]) sections, unchanged ones keep their counts and
+        track flags. The geometry of all sections is compiled into one PolylineCrossingEngine.
+        """
+        current = {(section.region_id, str(section.section_coordinates)): i for i, section in enumerate(self.sections)}
+        new_sections = []
+        columns = []
+        for region_id, reg_pts, coordinates, *section_type in sections:
+            index = current.get((region_id, str(coordinates)))
+            if index is None:
+                print(f"Counter {region_id} Analysis Initiated for feed {self.feed_id}: {reg_pts}")
+                new_sections.append(SectionCount(region_id, reg_pts, coordinates, *section_type))
+            else:
+                new_sections.append(self.sections[index])
+            columns.append(index)
+
+        self.initial_flags = np.array([section.initial_flags() for section in new_sections], dtype=bool).reshape(-1, 4)
+        zone_sections = [section for section in new_sections if section.reg_pts is not None]
+        current_zones = {id(section): z for z, section in enumerate(self.zone_sections)}
+        zone_columns = [current_zones.get(id(section)) for section in zone_sections]
+        for track in self.tracks.values():
+            flags = self.initial_flags.copy()
+            for i, index in enumerate(columns):
+                if index is not None:
+                    flags[i] = track.flags[index]
+            track.flags = flags
+            zone_entry = np.full(len(zone_sections), np.nan)
+            for z, index in enumerate(zone_columns):
+                if index is not None:
+                    zone_entry[z] = track.zone_entry[index]
+            track.zone_entry = zone_entry
+
+        self.sections = new_sections
+        self.overlay = None
+        self.zone_sections = zone_sections
+        self.zones = ZoneMask([section.reg_pts for section in zone_sections], self.width, self.height,
+                              scale=self.zone_mask_scale) if zone_sections else None
+        # Entry polyline 2 * i and exit polyline 2 * i + 1 of every section (the same one twice for a tripwire)
+        lines = []
+        for section in self.sections:
+            lines.append(section.entry_line)
+            lines.append(section.exit_line)
+        self.crossing = PolylineCrossingEngine(lines, indexed=self.section_index)
+        self.entry_lines = np.arange(len(self.sections)) * 2
+        self.exit_lines = self.entry_lines + 1
+
+    def counts(self):
+        return [(section.counter_name, section.entry_count, section.exit_count) for section in self.sections]
+
+    def live_sections(self):
+        return [section.live_state() for section in self.sections]
+
+    def track_stats(self):
+        return self.tracks.stats()
+
+    def zone_stats(self):
+        return {str(section.region_id): section.zone_stats() for section in self.zone_sections}
+
+    def render_static_overlay(self, shape):
+        # Section outlines never change between reloads, they are drawn once on a blank canvas and composited into
+        # every rendered frame by copying only their pixels
+        canvas = np.zeros(shape, dtype=np.uint8)
+        annotator = Annotator(canvas, self.tf, self.names)
+        for section in self.sections:
+            if section.reg_pts is not None:
+                annotator.draw_region(reg_pts=section.reg_pts, color=self.region_color, thickness=self.region_thickness)
+            else:
+                lines = [section.entry_line] if section.tripwire else [section.entry_line, section.exit_line]
+                cv2.polylines(canvas, [np.array(line, dtype=np.int32) for line in lines], False, self.region_color,
+                              self.region_thickness)
+        canvas = canvas.reshape(-1, shape[2])
+        pixels = np.flatnonzero(canvas.any(axis=1))
+        self.overlay = (shape, pixels, canvas[pixels])
+
+    def draw_overlay(self):
+        if self.overlay is None or self.overlay[0] != self.im0.shape:
+            self.render_static_overlay(self.im0.shape)
+        _, pixels, values = self.overlay
+        self.im0.reshape(-1, self.im0.shape[2])[pixels] = values
+
+        for section in self.sections:
+            if section.section_type == "zone":
+                cv2.putText(self.im0, f"Zone {section.region_id} Occupancy: {section.occupancy}", (50, 50 + section.region_id * 100), cv2.FONT_HERSHEY_SIMPLEX, 1, (36, 255, 12), 2)
+            else:
+                cv2.putText(self.im0, f"Entry {section.region_id} Count: {section.entry_count}", (50, 50 + section.region_id * 100), cv2.FONT_HERSHEY_SIMPLEX, 1, (36, 255, 12), 2)
+                cv2.putText(self.im0, f"Exit {section.region_id} Count: {section.exit_count}", (50, 100 + section.region_id * 100), cv2.FONT_HERSHEY_SIMPLEX, 1, (36, 255, 12), 2)
+        cv2.putText(self.im0, f"Frame: {self.frame_count}", (self.width - 300, self.height - 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (36, 255, 12), 2)
+
+    def render_overlay(self, im0):
+        # A frame that was not counted (motion gated) still shows the sections and the last counts
+        self.im0 = im0
+        self.draw_overlay()
+        return self.im0
+
+    def render(self):
+        """Draws the sections, counts, boxes and trails of the last counted frame on self.im0."""
+        self.draw_overlay()
+        if self.frame_data is None:
+            return
+        data, track_ids, frame_tracks = self.frame_data
+        annotator = Annotator(self.im0, self.tf, self.names)
+        for i, track_id in enumerate(track_ids):
+            annotator.box_label(data[i, :4], label=f"Person {track_id}", color=colors(int(data[i, -1]), True))
+            if self.draw_tracks:
+                track_line = frame_tracks[i].track_history
+                track_color = (int(255 * (len(track_line) / self.track_length)), 0, int(255 * (1 - len(track_line) / self.track_length)))
+                annotator.draw_centroid_and_tracks(track_line.array(), color=track_color, track_thickness=self.track_thickness)
+        self.im0 = annotator.result()
+
+    def process_tracks(self, tracks):
+        # Counting only, nothing is drawn here
+        self.frame_data = None
+        boxes = tracks[0].boxes
+        if boxes.id is None or not self.sections:
+            self.update_zones([], [], [])
+            self.tracks.evict(self.frame_count)
+            return
+        # Single device to host copy per frame: [x1, y1, x2, y2, track_id, conf, cls]
+        data = boxes.data.cpu().numpy()
+        feet_x = ((data[:, 0] + data[:, 2]) / 2).tolist()
+        feet_y = data[:, 3].tolist()
+        track_ids = data[:, 4].astype(np.int32).tolist()
+
+        frame_tracks = []
+        chord_tracks = []
+        starts = []
+        ends = []
+        for i, track_id in enumerate(track_ids):
+            track = self.tracks.get(track_id, self.frame_count)
+            frame_tracks.append(track)
+            track.last_seen = self.clock
+            track_line = track.track_history
+            foot_position = (feet_x[i], feet_y[i])
+            interpolate_track(track, self.frame_count, foot_position, self.track_length)
+            track_line.append(foot_position)
+
+            if len(track_line) >= self.backtrack_length:
+                chord_tracks.append(track)
+                starts.append(track_line[len(track_line) - self.backtrack_length - 1])
+                ends.append(track_line[len(track_line) - 1])
+
+        self.frame_data = (data, track_ids, frame_tracks)
+        self.update_zones(frame_tracks, feet_x, feet_y)
+        self.tracks.evict(self.frame_count)
+        if not chord_tracks:
+            return
+
+        # (N, S, 4) flags of all tracks in all sections, one crossing evaluation for the whole frame
+        flags = np.stack([track.flags for track in chord_tracks])
+        entries, exits, entry_first, entry_started, exit_started = self.crossing.step(
+            starts, ends, flags[:, :, 0], flags[:, :, 1], flags[:, :, 2], flags[:, :, 3],
+            entry_line=self.entry_lines, exit_line=self.exit_lines)
+        flags[:, :, 0] |= entries
+        flags[:, :, 1] |= exits
+        flags[:, :, 2] = entry_started
+        flags[:, :, 3] = exit_started
+        for track, track_flags in zip(chord_tracks, flags):
+            track.flags = track_flags
+
+        # Same event order as one counter per section: sections first, then tracks
+        fired = entries | exits
+        for s in np.flatnonzero(fired.any(axis=0)):
+            section = self.sections[s]
+            for n in np.flatnonzero(fired[:, s]):
+                if entries[n, s] and entry_first[n, s]:
+                    self.record_event(section, "entry")
+                if exits[n, s]:
+                    self.record_event(section, "exit")
+                if entries[n, s] and not entry_first[n, s]:
+                    self.record_event(section, "entry")
+
+    def update_zones(self, frame_tracks, feet_x, feet_y):
+        # One mask lookup for the feet of all tracks, then occupancy per zone and visits that start or end
+        if self.zones is None:
+            return
+        inside = self.zones.lookup(feet_x, feet_y)
+        for section, occupancy in zip(self.zone_sections, inside.sum(axis=0).tolist()):
+            section.occupancy = occupancy
+        if not frame_tracks:
+            return
+
+        zone_entry = np.stack([track.zone_entry for track in frame_tracks])
+        was_inside = ~np.isnan(zone_entry)
+        for n, z in zip(*np.nonzero(was_inside & ~inside)):
+            self.zone_sections[z].add_visit(self.clock - zone_entry[n, z])
+        zone_entry[inside & ~was_inside] = self.clock
+        zone_entry[~inside] = np.nan
+        for track, track_entry in zip(frame_tracks, zone_entry):
+            track.zone_entry = track_entry
+
+    def track_evicted(self, track_id, track):
+        # The track was last seen inside these zones
+        for z in np.flatnonzero(~np.isnan(track.zone_entry)):
+            self.zone_sections[z].add_visit(track.last_seen - track.zone_entry[z])
+
+    def record_event(self, section, attribute):
+        if attribute == "entry":
+            section.entry_count += 1
+        else:
+            section.exit_count += 1
+        curr_time = self.frame_time or datetime.now()
+        section.last_event_time = curr_time
+        self.query_obj.record_event(self.camera_id, self.feed_id, section.region_id, curr_time, attribute, self.source_frame)
+
+    def start_counting(self, im0, tracks, fc, frame_time=None, render=True, source_frame=None, timestamp=None):
+        # Headless unless render: the frame is only drawn on when it is going to be shown
+        self.im0 = im0
+        self.frame_count = fc
+        # fc counts the processed frames, events record the index of the frame in the source
+        self.source_frame = fc if source_frame is None else source_frame
+        self.frame_time = frame_time
+        # Video time of the frame offline, capture time live. Frame counts would miss the frames that capture_fps
+        # or the load stride dropped.
+        if frame_time is not None:
+            self.clock = frame_time.timestamp()
+        else:
+            self.clock = timestamp if timestamp is not None else time.time()
+        self.process_tracks(tracks)
+        if render:
+            self.render()
+        return self.im0
+
+
 if __name__ == "__main__":
     ObjectCounter()
\ No newline at end of file
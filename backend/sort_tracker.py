@@ -0,0 +1,112 @@
+import lap
+import numpy as np
+from ultralytics.trackers.utils.kalman_filter import KalmanFilterXYWH
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU of two (N, 4) and (M, 4) xyxy box arrays."""
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def xyxy_to_xywh(boxes):
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2,
+                     boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]], axis=1)
+
+
+def xywh_to_xyxy(boxes):
+    half_w = boxes[:, 2] / 2
+    half_h = boxes[:, 3] / 2
+    return np.stack([boxes[:, 0] - half_w, boxes[:, 1] - half_h, boxes[:, 0] + half_w, boxes[:, 1] + half_h], axis=1)
+
+
+class SortTracker:
+    """
+    Lightweight SORT style tracker: a constant velocity Kalman filter per track (centre and size) and IoU
+    association solved with lapjv.
+
+    Unlike BoT-SORT it can run without detections: predict() moves every track one frame ahead, update() predicts
+    and then corrects with a new set of detections. This is what lets the detector run only every k frames.
+    Tracks that miss more than max_age detection rounds are removed, tracks that missed the last round are kept
+    for re-association but not reported.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=3, new_track_conf=0.3):
+        self.kf = KalmanFilterXYWH()
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.new_track_conf = new_track_conf
+        self.next_id = 1
+        self.reset()
+
+    def reset(self):
+        self.means = np.empty((0, 8))
+        self.covs = np.empty((0, 8, 8))
+        self.ids = np.empty(0, dtype=np.int64)
+        self.conf = np.empty(0, dtype=np.float32)
+        self.cls = np.empty(0, dtype=np.float32)
+        self.misses = np.empty(0, dtype=np.int64)
+
+    def _boxes(self):
+        xywh = self.means[:, :4].copy()
+        xywh[:, 2:] = np.maximum(xywh[:, 2:], 1)
+        return xywh_to_xyxy(xywh)
+
+    def predict(self):
+        """Advances all tracks by one frame and returns them as (N, 7) [x1, y1, x2, y2, track_id, conf, cls]."""
+        if len(self.means):
+            self.means, self.covs = self.kf.multi_predict(self.means, self.covs)
+        return self.tracks()
+
+    def update(self, dets):
+        """Advances all tracks by one frame and associates an (N, 6) array of [x1, y1, x2, y2, conf, cls]."""
+        if len(self.means):
+            self.means, self.covs = self.kf.multi_predict(self.means, self.covs)
+
+        matched_tracks = np.full(len(self.means), -1)
+        unmatched_dets = np.ones(len(dets), dtype=bool)
+        if len(self.means) and len(dets):
+            iou = iou_matrix(self._boxes(), dets[:, :4])
+            # Boxes of a different class never match
+            iou[self.cls[:, None] != dets[None, :, 5]] = 0
+            _, matched_tracks, _ = lap.lapjv(1 - iou, extend_cost=True, cost_limit=1 - self.iou_threshold)
+
+        measurements = xyxy_to_xywh(dets[:, :4]) if len(dets) else np.empty((0, 4))
+        for t, d in enumerate(matched_tracks):
+            if d < 0:
+                self.misses[t] += 1
+                continue
+            self.means[t], self.covs[t] = self.kf.update(self.means[t], self.covs[t], measurements[d])
+            self.conf[t] = dets[d, 4]
+            self.misses[t] = 0
+            unmatched_dets[d] = False
+
+        keep = self.misses <= self.max_age
+        self.means, self.covs = self.means[keep], self.covs[keep]
+        self.ids, self.conf, self.cls, self.misses = self.ids[keep], self.conf[keep], self.cls[keep], self.misses[keep]
+
+        new = np.flatnonzero(unmatched_dets & (dets[:, 4] >= self.new_track_conf)) if len(dets) else []
+        if len(new):
+            states = [self.kf.initiate(measurements[d]) for d in new]
+            self.means = np.concatenate([self.means, [mean for mean, _ in states]])
+            self.covs = np.concatenate([self.covs, [cov for _, cov in states]])
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + len(new))])
+            self.conf = np.concatenate([self.conf, dets[new, 4]])
+            self.cls = np.concatenate([self.cls, dets[new, 5]])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=np.int64)])
+            self.next_id += len(new)
+
+        return self.tracks()
+
+    def tracks(self):
+        active = self.misses == 0
+        if not active.any():
+            return np.empty((0, 6), dtype=np.float32)
+        return np.concatenate([self._boxes()[active], self.ids[active, None], self.conf[active, None],
+                               self.cls[active, None]], axis=1).astype(np.float32)
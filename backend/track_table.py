@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class TrackHistory:
+    """
+    Last `capacity` positions of a track in a preallocated ring buffer. Behaves like the list it replaces for the
+    counters: append, len, indexing (negative too) and iteration from oldest to newest.
+    """
+    __slots__ = ("points", "start", "length")
+
+    def __init__(self, capacity=30):
+        self.points = np.empty((capacity, 2), dtype=np.float64)
+        self.start = 0
+        self.length = 0
+
+    def append(self, point):
+        capacity = len(self.points)
+        if self.length < capacity:
+            self.points[(self.start + self.length) % capacity] = point
+            self.length += 1
+        else:
+            # Full: overwrite the oldest point
+            self.points[self.start] = point
+            self.start = (self.start + 1) % capacity
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("track history index out of range")
+        x, y = self.points[(self.start + index) % len(self.points)]
+        return (float(x), float(y))
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self[i]
+
+    def array(self):
+        """Ordered (len, 2) copy, oldest point first (for drawing)."""
+        return np.roll(self.points, -self.start, axis=0)[:self.length]
+
+
+class TrackTable:
+    """
+    Per-track state keyed by track id, evicted once a track has not been seen for ttl_frames frames.
+    Trackers never reuse an id, and they drop lost tracks long before the default ttl, so eviction does not
+    change any count; it only keeps the state of a 24/7 feed from growing forever.
+    """
+
+    def __init__(self, factory, ttl_frames=300, evict_interval=30, on_evict=None):
+        self.factory = factory
+        # Called with (track_id, state) for every evicted track
+        self.on_evict = on_evict
+        self.ttl_frames = ttl_frames
+        self.evict_interval = evict_interval
+        self.tracks = {}
+        self.last_seen = {}
+        self.last_evict_frame = None
+        self.evicted = 0
+
+    def get(self, track_id, frame):
+        """Returns the state of track_id, created on first sight, and marks it seen on frame."""
+        state = self.tracks.get(track_id)
+        if state is None:
+            state = self.tracks[track_id] = self.factory()
+        self.last_seen[track_id] = frame
+        return state
+
+    def __getitem__(self, track_id):
+        return self.tracks[track_id]
+
+    def __contains__(self, track_id):
+        return track_id in self.tracks
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def values(self):
+        return self.tracks.values()
+
+    def evict(self, frame):
+        # Scans the table every evict_interval frames only, so the cost per frame stays negligible
+        if self.last_evict_frame is not None and frame - self.last_evict_frame < self.evict_interval:
+            return 0
+        self.last_evict_frame = frame
+        stale = [track_id for track_id, seen in self.last_seen.items() if frame - seen > self.ttl_frames]
+        for track_id in stale:
+            if self.on_evict is not None:
+                self.on_evict(track_id, self.tracks[track_id])
+            del self.tracks[track_id]
+            del self.last_seen[track_id]
+        self.evicted += len(stale)
+        return len(stale)
+
+    def stats(self):
+        return {"live_tracks": len(self.tracks), "evicted_tracks": self.evicted}
@@ -0,0 +1,60 @@
+import numpy as np
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils.checks import check_yaml
+
+try:
+    from ultralytics.utils import yaml_load
+except ImportError:
+    from ultralytics.utils import YAML
+    yaml_load = YAML.load
+
+from ultralytics.utils import IterableSimpleNamespace
+
+# Width BoT-SORT camera motion compensation works at, the legacy target-size frames were halved to about this
+GMC_WIDTH = 512
+
+
+def fit_gmc(tracker, width):
+    # GMC only takes an integer downscale, it scales the estimated translation back up by the same factor
+    gmc = getattr(tracker, "gmc", None)
+    if gmc is not None:
+        gmc.downscale = max(2, round(width / GMC_WIDTH))
+
+
+class FeedTracker:
+    """Per-feed multi object tracker fed with detections produced elsewhere (shared model, batch inference, etc.)."""
+
+    def __init__(self, tracker="botsort.yaml", frame_rate=30):
+        cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker)))
+        if cfg.tracker_type not in TRACKER_MAP:
+            raise ValueError(f"Unsupported tracker type: {cfg.tracker_type}")
+        try:
+            self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+        except TypeError:
+            # Newer ultralytics releases dropped the frame_rate argument
+            self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg)
+
+    def update(self, result):
+        """
+        Updates the tracker with one frame worth of detections, same as model.track(persist=True) does.
+
+        Returns an (N, 7) array of [x1, y1, x2, y2, track_id, conf, cls], or an (N, 6) untracked array
+        when nothing could be associated (matching the ultralytics behaviour of boxes.id being None).
+        """
+        return self.update_detections(result.boxes.data.cpu().numpy(), result.orig_img)
+
+    def update_detections(self, dets, img):
+        """Same as update, for an (N, 6) array of [x1, y1, x2, y2, conf, cls] detections on img."""
+        if len(dets) == 0:
+            return np.empty((0, 6), dtype=np.float32)
+
+        fit_gmc(self.tracker, img.shape[1])
+        tracks = self.tracker.update(Boxes(dets, img.shape[:2]), img)
+        if len(tracks) == 0:
+            return np.empty((0, 6), dtype=np.float32)
+
+        return tracks[:, :-1].astype(np.float32)
+
+    def reset(self):
+        self.tracker.reset()
@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import time
+
+
+def stats_path(feed_id):
+    return os.path.join(tempfile.gettempdir(), "avian_stats_" + str(feed_id) + ".json")
+
+
+def read_feed_stats(feed_id):
+    try:
+        with open(stats_path(feed_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class FeedStats:
+    """Per-feed runtime metrics, periodically written to a small json file the API can serve."""
+
+    def __init__(self, feed_id, interval=1.0):
+        self.feed_id = feed_id
+        self.path = stats_path(feed_id)
+        self.interval = interval
+        self.last_published = 0
+        self.values = {"feed_id": feed_id, "pid": os.getpid()}
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def incr(self, key, amount=1):
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def publish(self, force=False):
+        now = time.time()
+        if not force and now - self.last_published < self.interval:
+            return
+        self.last_published = now
+        self.values["updated_at"] = now
+        # Write to a temp file and rename so readers never see a partial file
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.values, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,261 @@
+import asyncio
+import glob
+import os
+import socket
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+from utils.shm import attach_segment, create_segment
+
+# Shared memory layout, all little endian:
+#   header (64 bytes): magic, version, slot_count, slot_size, writer_pid, write_seq, reader_heartbeat, created_at
+#   slot_count x [slot header (64 bytes): seq_begin, seq_end, width, height, channels, length, timestamp][data]
+# The writer bumps seq_begin, writes the frame, then sets seq_end (a per-slot seqlock). A reader checks seq_end
+# before and seq_begin after touching the data; if both still equal the expected sequence the read was not torn.
+# After committing a frame the writer sends a datagram to the unix socket of every reader process of the feed (one
+# per API worker, found by name), so readers in the API can await new frames on the event loop instead of polling. The send is a syscall, which also orders the shared memory
+# stores before the reader is woken up.
+FRAME_BUS_MAGIC = b"AVFB"
+FRAME_BUS_VERSION = 1
+HEADER = struct.Struct("<4sIIIIQdd")
+HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct("<QQIIIId")
+SLOT_HEADER_SIZE = 64
+WRITE_SEQ_OFFSET = 20
+HEARTBEAT_OFFSET = 28
+READER_TIMEOUT = 2.0
+# Seconds between scans of the writer for the notification sockets of new reader processes
+NOTIFY_RESCAN_INTERVAL = 1.0
+
+
+def frame_bus_name(feed_id):
+    return "avian_bus_" + str(feed_id)
+
+
+def frame_bus_notify_path(name, pid=None):
+    return os.path.join(tempfile.gettempdir(), f"{name}.{pid or os.getpid()}.notify")
+
+
+class FrameBusWriter:
+    """Single producer side of the frame bus: a versioned multi-slot ring of raw frames in shared memory."""
+
+    def __init__(self, name, width, height, channels=3, slot_count=4):
+        self.name = name
+        self.slot_count = slot_count
+        self.slot_size = width * height * channels
+        self.size = HEADER_SIZE + slot_count * (SLOT_HEADER_SIZE + self.slot_size)
+        self.shm = self._create()
+        self.buf = self.shm.buf
+        self.write_seq = 0
+        HEADER.pack_into(self.buf, 0, FRAME_BUS_MAGIC, FRAME_BUS_VERSION, slot_count, self.slot_size, os.getpid(),
+                         0, 0.0, time.time())
+        self.notify_pattern = os.path.join(tempfile.gettempdir(), name + ".*.notify")
+        self.notify_paths = []
+        self.notify_scanned = 0
+        self.notify_sock = None
+        try:
+            self.notify_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.notify_sock.setblocking(False)
+        except (AttributeError, OSError):
+            # No unix datagram sockets on this platform, readers fall back to polling
+            self.notify_sock = None
+
+    def _create(self):
+        def writer_pid(buf):
+            magic, _, _, _, pid, _, _, _ = HEADER.unpack_from(buf, 0)
+            return pid if magic == FRAME_BUS_MAGIC else None
+        return create_segment(self.name, self.size, writer_pid, "Frame bus")
+
+    def _slot_offset(self, seq):
+        return HEADER_SIZE + (seq % self.slot_count) * (SLOT_HEADER_SIZE + self.slot_size)
+
+    def write(self, frame):
+        frame = np.ascontiguousarray(frame)
+        length = frame.nbytes
+        if length > self.slot_size:
+            raise ValueError(f"Frame of {length} bytes does not fit a {self.slot_size} bytes slot")
+
+        seq = self.write_seq + 1
+        offset = self._slot_offset(seq)
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+
+        struct.pack_into("<Q", self.buf, offset, seq)
+        self.buf[offset + SLOT_HEADER_SIZE:offset + SLOT_HEADER_SIZE + length] = frame.reshape(-1).data
+        SLOT_HEADER.pack_into(self.buf, offset, seq, seq, width, height, channels, length, time.time())
+        struct.pack_into("<Q", self.buf, WRITE_SEQ_OFFSET, seq)
+        self.write_seq = seq
+        self._notify(seq)
+        return seq
+
+    def _notify(self, seq):
+        if self.notify_sock is None:
+            return
+        now = time.monotonic()
+        if now - self.notify_scanned >= NOTIFY_RESCAN_INTERVAL:
+            self.notify_scanned = now
+            self.notify_paths = glob.glob(self.notify_pattern)
+        message = struct.pack("<Q", seq)
+        for path in self.notify_paths:
+            try:
+                self.notify_sock.sendto(message, path)
+            except ConnectionRefusedError:
+                # Left behind by a reader process that died, nothing is bound to it any more
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError:
+                # Gone since the last scan, or the reader is behind and its queue is full
+                pass
+
+    def has_readers(self):
+        heartbeat = struct.unpack_from("<d", self.buf, HEARTBEAT_OFFSET)[0]
+        return time.time() - heartbeat < READER_TIMEOUT
+
+    def close(self):
+        if self.notify_sock is not None:
+            self.notify_sock.close()
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FrameBusReader:
+    """
+    One independent reader of the frame bus. Frames are returned as numpy views into shared memory (no copy),
+    so callers must call is_valid(seq) after they are done with a frame to make sure it was not overwritten.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.shm = attach_segment(name)
+        self.buf = self.shm.buf
+        magic, version, self.slot_count, self.slot_size, _, _, _, _ = HEADER.unpack_from(self.buf, 0)
+        if magic != FRAME_BUS_MAGIC or version != FRAME_BUS_VERSION:
+            self.shm.close()
+            raise ValueError(f"Frame bus {name} has an unsupported layout (version {version})")
+
+    @classmethod
+    def attach(cls, name):
+        try:
+            return cls(name)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def latest_seq(self):
+        return struct.unpack_from("<Q", self.buf, WRITE_SEQ_OFFSET)[0]
+
+    def _slot_offset(self, seq):
+        return HEADER_SIZE + (seq % self.slot_count) * (SLOT_HEADER_SIZE + self.slot_size)
+
+    def read(self, after_seq=0):
+        """Returns (seq, timestamp, frame view) for the newest frame newer than after_seq, or None."""
+        struct.pack_into("<d", self.buf, HEARTBEAT_OFFSET, time.time())
+        seq = self.latest_seq()
+        if seq == 0 or seq <= after_seq:
+            return None
+
+        offset = self._slot_offset(seq)
+        seq_begin, seq_end, width, height, channels, length, timestamp = SLOT_HEADER.unpack_from(self.buf, offset)
+        if seq_begin != seq or seq_end != seq:
+            return None
+
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        frame = np.ndarray(shape, dtype=np.uint8, buffer=self.buf, offset=offset + SLOT_HEADER_SIZE)
+        return seq, timestamp, frame
+
+    def is_valid(self, seq):
+        # Writer bumps seq_begin before touching the slot, so an unchanged value means the data was intact
+        return struct.unpack_from("<Q", self.buf, self._slot_offset(seq))[0] == seq
+
+    def close(self):
+        self.buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A frame view is still alive somewhere, the mapping goes away with the process
+            pass
+
+
+class FrameBusWaiter:
+    """
+    Lets asyncio tasks await the next frame of a feed without blocking the event loop. One waiter per feed and
+    process is shared by all the viewers of that feed: the notification socket is watched with loop.add_reader and
+    every datagram resolves the current future, waking all waiting tasks at once. Each process binds its own socket
+    path, so several API workers can wait on the same feed.
+    """
+
+    def __init__(self, name):
+        self.path = frame_bus_notify_path(name)
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.sock = None
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            # Only ever our own path, left behind by an earlier process with the same pid
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            sock.bind(self.path)
+            sock.setblocking(False)
+            self.loop.add_reader(sock.fileno(), self._on_readable)
+            self.sock = sock
+        except (AttributeError, OSError, NotImplementedError) as e:
+            print("Frame notifications unavailable for", name, ", falling back to polling:", e)
+
+    def _on_readable(self):
+        while True:
+            try:
+                self.sock.recv(64)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break
+        if not self.future.done():
+            self.future.set_result(None)
+        self.future = self.loop.create_future()
+
+    async def wait(self, timeout):
+        if self.sock is None:
+            await asyncio.sleep(min(timeout, 0.05))
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def close(self):
+        if self.sock is None:
+            return
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# One waiter per feed and process, shared by all the viewers of the feed: feed_id -> [waiter, viewers]
+frame_waiters = {}
+
+
+def acquire_frame_waiter(feed_id):
+    if feed_id not in frame_waiters:
+        frame_waiters[feed_id] = [FrameBusWaiter(frame_bus_name(feed_id)), 0]
+    frame_waiters[feed_id][1] += 1
+    return frame_waiters[feed_id][0]
+
+
+def release_frame_waiter(feed_id):
+    if feed_id not in frame_waiters:
+        return
+    frame_waiters[feed_id][1] -= 1
+    if frame_waiters[feed_id][1] <= 0:
+        frame_waiters.pop(feed_id)[0].close()
@@ -0,0 +1,146 @@
+import glob
+import os
+import struct
+import threading
+import time
+
+from utils.shm import attach_segment, create_segment, pid_alive
+
+# Shared memory layout, all little endian:
+#   header (64 bytes): magic, version, writer_pid, seq, updated_at, fps, section_count
+#   max_sections x section (40 bytes): section_id, entries, exits, occupancy, last_event_time (0 when none yet)
+# The writer makes seq odd while it updates the record and even again when done (a seqlock). A reader retries
+# until it sees the same even seq before and after copying the record.
+LIVE_STATE_MAGIC = b"AVLS"
+LIVE_STATE_VERSION = 1
+HEADER = struct.Struct("<4sIIQddI")
+HEADER_SIZE = 64
+SECTION = struct.Struct("<qqqqd")
+SEQ_OFFSET = 12
+MAX_SECTIONS = 256
+
+
+def live_state_name(feed_id):
+    return "avian_live_" + str(feed_id)
+
+
+class LiveStateWriter:
+    """Per-feed live counts (entries, exits and occupancy per section, fps, last event time) in shared memory."""
+
+    def __init__(self, feed_id, max_sections=MAX_SECTIONS):
+        self.name = live_state_name(feed_id)
+        self.max_sections = max_sections
+        self.size = HEADER_SIZE + max_sections * SECTION.size
+        self.shm = self._create()
+        self.buf = self.shm.buf
+        self.seq = 0
+        HEADER.pack_into(self.buf, 0, LIVE_STATE_MAGIC, LIVE_STATE_VERSION, os.getpid(), 0, time.time(), 0.0, 0)
+
+    def _create(self):
+        def writer_pid(buf):
+            magic, _, pid, _, _, _, _ = HEADER.unpack_from(buf, 0)
+            return pid if magic == LIVE_STATE_MAGIC else None
+        return create_segment(self.name, self.size, writer_pid, "Live state")
+
+    def write(self, fps, sections):
+        """sections: (section_id, entries, exits, occupancy, last_event_time) tuples."""
+        sections = sections[:self.max_sections]
+        self.seq += 1
+        struct.pack_into("<Q", self.buf, SEQ_OFFSET, self.seq)
+        for i, section in enumerate(sections):
+            SECTION.pack_into(self.buf, HEADER_SIZE + i * SECTION.size, *section)
+        # Header fields keep the odd seq, the even seq is stored last so a reader never pairs it with a stale count
+        HEADER.pack_into(self.buf, 0, LIVE_STATE_MAGIC, LIVE_STATE_VERSION, os.getpid(), self.seq, time.time(),
+                         float(fps), len(sections))
+        self.seq += 1
+        struct.pack_into("<Q", self.buf, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        # Readers still attached to this segment see a writer pid of 0 and attach to the next one
+        struct.pack_into("<I", self.buf, 8, 0)
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class LiveStateReader:
+    def __init__(self, feed_id):
+        self.feed_id = feed_id
+        self.shm = attach_segment(live_state_name(feed_id))
+        self.buf = self.shm.buf
+        magic, version, _, _, _, _, _ = HEADER.unpack_from(self.buf, 0)
+        if magic != LIVE_STATE_MAGIC or version != LIVE_STATE_VERSION:
+            self.close()
+            raise ValueError(f"Live state of feed {feed_id} has an unsupported layout (version {version})")
+
+    @classmethod
+    def attach(cls, feed_id):
+        try:
+            return cls(feed_id)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def read(self, retries=100):
+        for _ in range(retries):
+            # seq is loaded on its own first, one unpack of the whole header may load its fields in any order
+            seq = struct.unpack_from("<Q", self.buf, SEQ_OFFSET)[0]
+            if seq % 2:
+                continue
+            _, _, writer_pid, _, updated_at, fps, section_count = HEADER.unpack_from(self.buf, 0)
+            data = bytes(self.buf[HEADER_SIZE:HEADER_SIZE + section_count * SECTION.size])
+            if struct.unpack_from("<Q", self.buf, SEQ_OFFSET)[0] != seq:
+                continue
+            sections = [dict(zip(("section_id", "entries", "exits", "occupancy", "last_event_time"), section))
+                        for section in SECTION.iter_unpack(data)]
+            for section in sections:
+                section["last_event_time"] = section["last_event_time"] or None
+            # Counting can pause on static scenes, a record is only stale once its worker is gone
+            return {"feed_id": self.feed_id, "pid": writer_pid, "fps": fps, "updated_at": updated_at,
+                    "stale": not pid_alive(writer_pid), "sections": sections}
+        return None
+
+    def close(self):
+        self.buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+
+def running_live_state_feeds():
+    # POSIX shared memory segments are files under /dev/shm on Linux
+    names = (os.path.basename(path)[len("avian_live_"):] for path in glob.glob("/dev/shm/avian_live_*"))
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+readers = {}
+readers_lock = threading.Lock()
+
+
+def read_live_state(feed_id):
+    # Readers stay attached between calls, a read is a copy out of shared memory without any system call
+    # beyond the liveness check of the writer
+    with readers_lock:
+        reader = readers.get(feed_id)
+        if reader is None:
+            reader = LiveStateReader.attach(feed_id)
+            if reader is None:
+                return None
+            readers[feed_id] = reader
+    state = reader.read()
+    if state is not None and not state["stale"]:
+        return state
+
+    # The worker stopped or was restarted with a new segment. The old reader may still be in use by another
+    # request, it is only dropped from the cache and closes once unreferenced.
+    with readers_lock:
+        if readers.get(feed_id) is reader:
+            del readers[feed_id]
+        reader = LiveStateReader.attach(feed_id)
+        if reader is None:
+            return state
+        readers[feed_id] = reader
+    return reader.read() or state
@@ -0,0 +1,53 @@
+import os
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+
+def pid_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def create_segment(name, size, writer_pid, description="Segment"):
+    """
+    Creates the named segment of a single writer. A segment left over by a writer that was killed is replaced,
+    one whose writer is still running raises RuntimeError. writer_pid(buf) returns the pid stored in the header
+    of an existing segment, or None when the segment has another layout.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        pass
+
+    stale = shared_memory.SharedMemory(name=name)
+    try:
+        pid = writer_pid(stale.buf)
+    except struct.error:
+        pid = None
+    if pid is not None and pid != os.getpid() and pid_alive(pid):
+        stale.close()
+        raise RuntimeError(f"{description} {name} is in use by process {pid}")
+    print("Removing stale segment", name)
+    stale.close()
+    stale.unlink()
+    return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+
+def attach_segment(name):
+    """Maps an existing segment for reading, raises FileNotFoundError when it does not exist."""
+    shm = shared_memory.SharedMemory(name=name)
+    # Readers must never unlink the segment, keep the resource tracker from doing it on exit
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
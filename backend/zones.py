@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+
+_BITS = 64
+
+
+class ZoneMask:
+    """
+    Section polygons rasterised once into a bit mask, bit i of a pixel is set when the pixel is inside zone i, so
+    zones may overlap. The zone membership of all the points of a frame is then one lookup per 64 zones instead of a
+    shapely Polygon.contains per point and zone.
+
+    The mask is kept at `scale` of the frame size; membership is exact away from the zone borders and off by at
+    most 1 / scale pixels along them.
+    """
+
+    def __init__(self, zones, width, height, scale=0.5):
+        self.num_zones = len(zones)
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.mask_width = max(1, int(round(width * scale)))
+        self.mask_height = max(1, int(round(height * scale)))
+
+        self.planes = []
+        scratch = np.zeros((self.mask_height, self.mask_width), dtype=np.uint8)
+        for first in range(0, self.num_zones, _BITS):
+            plane_zones = zones[first:first + _BITS]
+            # Smallest dtype that holds one bit per zone of the plane
+            dtype = next(dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+                         if np.iinfo(dtype).bits >= len(plane_zones))
+            plane = np.zeros((self.mask_height, self.mask_width), dtype=dtype)
+            for bit, polygon in enumerate(plane_zones):
+                scratch[:] = 0
+                # Vertices with 4 fractional bits, pixel centres are at integer coordinates
+                points = np.round(np.asarray(polygon, dtype=np.float64).reshape(-1, 2) * scale * 16).astype(np.int32)
+                cv2.fillPoly(scratch, [points], 1, shift=4)
+                plane[scratch > 0] |= dtype(1 << bit)
+            self.planes.append(plane)
+
+    def lookup(self, xs, ys):
+        """Returns the (N, Z) zone membership of N points given in frame coordinates."""
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        inside = np.zeros((len(xs), self.num_zones), dtype=bool)
+        if not len(xs) or not self.num_zones:
+            return inside
+
+        in_frame = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        ix = np.clip(np.rint(xs * self.scale).astype(np.intp), 0, self.mask_width - 1)
+        iy = np.clip(np.rint(ys * self.scale).astype(np.intp), 0, self.mask_height - 1)
+        for p, plane in enumerate(self.planes):
+            bits = plane[iy, ix]
+            num_bits = min(_BITS, self.num_zones - p * _BITS)
+            shifts = np.arange(num_bits, dtype=plane.dtype)
+            inside[:, p * _BITS:p * _BITS + num_bits] = (bits[:, None] >> shifts) & 1
+        inside &= in_frame[:, None]
+        return inside
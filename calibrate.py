@@ -1,9 +1,13 @@
 # Find max width and height of the person
+import os
+import sys
 import cv2
-from ultralytics import YOLO
 import numpy as np
 
-model = YOLO('yolov8n.pt')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from detectors import create_detector
+
+model = create_detector("ultralytics", 'yolov8n.pt')
 cap = cv2.VideoCapture("test3.mp4")
 assert cap.isOpened(), "Error reading video file"
 
@@ -14,6 +18,11 @@ frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 if frame_count is None:
     frame_count = 0
 
+def show_detections(frame):
+    for x1, y1, x2, y2 in model.detect([frame], classes=classes_to_detect)[0][:, :4].astype(int):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    cv2.imshow("Calibrate", frame)
+
 def calibrate(num_frames):
     # Find max width and height of the person
     max_width = 0
@@ -26,9 +35,8 @@ def calibrate(num_frames):
         if not ret:
             break
         fc += 1
-        results = model(frame, verbose=False, classes=classes_to_detect)
-        boxes = results[0].boxes.xyxy.cpu()
-        for result in boxes.numpy():
+        boxes = model.detect([frame], classes=classes_to_detect)[0][:, :4]
+        for result in boxes:
             width = result[2] - result[0]
             height = result[3] - result[1]
             if width > max_width:
@@ -51,12 +59,12 @@ def calibrate(num_frames):
     #Read that frame and display with bounding box
     cap.set(cv2.CAP_PROP_POS_FRAMES, max_frame_width)
     ret, frame = cap.read()
-    results = model(frame, verbose=False, classes = classes_to_detect, show=True)
+    show_detections(frame)
     cv2.waitKey(0)
     
     cap.set(cv2.CAP_PROP_POS_FRAMES, max_frame_height)
     ret, frame = cap.read()
-    results = model(frame, verbose=False, classes = classes_to_detect, show=True)
+    show_detections(frame)
     cv2.waitKey(0)
     
     cv2.destroyAllWindows()
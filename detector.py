@@ -1,13 +1,17 @@
 # AVIAN: Advanced Vision Analytics
-from ultralytics import YOLO
+import os
+import sys
 import counter as counter
 import cv2
 import argparse
 
-def run_detection(video_path):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from detectors import DETECTOR_BACKENDS, create_detector
+
+def run_detection(video_path, backend="ultralytics"):
     classes_to_count = [0]  # We are only counting people  
-    # Load the YOLO model
-    model = YOLO("yolov8x.pt")
+    # Load the model on the chosen detector backend
+    model = create_detector(backend, "yolov8x.pt")
     cap = cv2.VideoCapture(video_path)
     
     # Check if the video file is opened
@@ -37,7 +41,10 @@ if __name__ == "__main__":
     # Parse arguments using arparge for video path
     parser = argparse.ArgumentParser(description="Counting the number of objects in a video")
     parser.add_argument("video_path", type=str, help="Path to the stream/video")
+    # Replay needs recorded detections and has no window of its own to show them in
+    parser.add_argument("--backend", type=str, default="ultralytics",
+                        choices=[backend for backend in DETECTOR_BACKENDS if backend != "replay"])
     args = parser.parse_args()
 
     # Call a new function for counting the objects in the video
-    run_detection(args.video_path)
\ No newline at end of file
+    run_detection(args.video_path, args.backend)
\ No newline at end of file